@@ -0,0 +1,52 @@
+"""
+Measures ProductGraph build time for synthetic hierarchies of increasing size,
+serially and with a pool of worker processes.
+
+    python -m benchmarks.bench_build --sizes 10000,100000,500000 --processes 4
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import os
+import time
+
+from benchmarks.generators import generate_hierarchy
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+
+
+def generate_products(count):
+    for record in generate_hierarchy(count):
+        yield Product(
+            id=record["id"], name=record["product"], frequency=record["recipe_count"]
+        )
+
+
+def build(count, processes):
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(generate_products(count), processes=processes)
+    return graph, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,500000")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    for size in map(int, args.sizes.split(",")):
+        serial, serial_seconds = build(size, 1)
+        parallel, parallel_seconds = build(size, args.processes)
+        assert parallel.product_index.index == serial.product_index.index
+        assert parallel.name_terms == serial.name_terms
+        print(
+            f"{size:>7} products: serial {serial_seconds:7.1f}s, "
+            f"{args.processes} processes {parallel_seconds:7.1f}s "
+            f"({serial_seconds / parallel_seconds:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares ingredient and direction throughput (in lines per second) when each
+recipe is posted individually, and when recipes are posted in bulk as NDJSON.
+
+    python -m benchmarks.bench_bulk --recipes 500
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import time
+
+from benchmarks.generators import (
+    generate_direction_lines,
+    generate_hierarchy,
+    generate_ingredient_lines,
+)
+from web.app import app
+from web.directions import load_equipment_queries
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+
+
+def run_single(client, path, recipes):
+    for recipe in recipes:
+        client.post(path, data={"descriptions[]": recipe}).data
+
+
+def run_bulk(client, path, recipes):
+    body = "".join(json.dumps({"descriptions": recipe}) + "\n" for recipe in recipes)
+    response = client.post(path, data=body, content_type="application/x-ndjson")
+    for line in response.response:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--recipes", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=15)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        app.graph_manager.graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+
+    queries = load_equipment_queries()
+    equipment = queries["appliance"] + queries["vessel"]
+    workloads = {
+        "ingredients": [
+            list(generate_ingredient_lines(hierarchy, args.lines, seed))
+            for seed in range(args.recipes)
+        ],
+        "directions": [
+            list(generate_direction_lines(equipment, args.lines, seed))
+            for seed in range(args.recipes)
+        ],
+    }
+
+    client = app.test_client()
+    total_lines = args.recipes * args.lines
+    for endpoint, recipes in workloads.items():
+        for mode, run, path in (
+            ("single", run_single, f"/{endpoint}/query"),
+            ("bulk", run_bulk, f"/{endpoint}/bulk"),
+        ):
+            started = time.perf_counter()
+            run(client, path, recipes)
+            duration = time.perf_counter() - started
+            print(f"{endpoint:>12} {mode:>6}: {total_lines / duration:9.0f} lines/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Compares latency and throughput of the Flask deployment (gunicorn) and the ASGI
+entry point (uvicorn, if installed) under many concurrent recipe-sized
+ingredient queries, generated locally.
+
+    python -m benchmarks.bench_concurrency --products 20000 --concurrency 64
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import http.client
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from benchmarks.generators import generate_hierarchy, generate_ingredient_lines
+from benchmarks.hierarchy_server import HierarchyServer
+from web.loader import retrieve_hierarchy
+from web.models.product_graph import ProductGraph
+
+SERVERS = {
+    "flask": [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "--config",
+        "python:web.gunicorn_config",
+        "web.app:app",
+    ],
+    "asgi": [sys.executable, "-m", "uvicorn", "web.asgi:app", "--log-level", "error"],
+}
+
+
+def build_snapshot(url, path):
+    # Servers load this snapshot (after revalidating the hierarchy), so they do
+    # not need the generated stopwords file
+    with redirect_stdout(io.StringIO()):
+        hierarchy = retrieve_hierarchy(url=url)
+        graph = ProductGraph(hierarchy)
+        graph.validators = hierarchy.validators
+        graph.save_snapshot(path)
+
+
+def start_server(name, port, workers, env):
+    command = list(SERVERS[name])
+    if name == "asgi":
+        command += ["--port", str(port), "--workers", str(workers)]
+    env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(workers))
+    server = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    body = urlencode({"descriptions[]": ["onion"]}, doseq=True)
+    for _ in range(600):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            connection.request("POST", "/ingredients/query", body, form_headers())
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"{name} server did not become ready")
+
+
+def form_headers():
+    return {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def run_load(port, bodies, concurrency):
+    def client(worker):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        latencies, rejected = [], 0
+        for body in bodies[worker::concurrency]:
+            started = time.perf_counter()
+            connection.request("POST", "/ingredients/query", body, form_headers())
+            response = connection.getresponse()
+            response.read()
+            if response.status == 429:
+                rejected += 1
+                continue
+            assert response.status == 200, response.status
+            latencies.append(time.perf_counter() - started)
+        return latencies, rejected
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    rejected = sum(rejected for _, rejected in results)
+    return {
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "throughput": len(latencies) / elapsed,
+        "rejected": rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--lines", type=int, default=15)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--cache", action="store_true", help="enable result caching")
+    args = parser.parse_args()
+
+    records = list(generate_hierarchy(args.products))
+    backend = HierarchyServer(records, ("127.0.0.1", 0))
+    backend.start()
+
+    lines = list(generate_ingredient_lines(records, args.requests * args.lines))
+    bodies = []
+    for start in range(0, len(lines), args.lines):
+        end = start + args.lines
+        bodies.append(urlencode({"descriptions[]": lines[start:end]}, doseq=True))
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "graph.snapshot")
+        build_snapshot(backend.url, snapshot_path)
+        env = dict(
+            os.environ,
+            HIERARCHY_URL=backend.url,
+            GRAPH_SNAPSHOT_PATH=snapshot_path,
+        )
+        if not args.cache:
+            env["RESULT_CACHE_ENTRIES"] = "0"
+
+        for offset, name in enumerate(SERVERS):
+            if name == "asgi" and not importlib.util.find_spec("uvicorn"):
+                print(f"{name:>6}: skipped (uvicorn is not installed)")
+                continue
+            port = args.port + offset
+            server = start_server(name, port, args.workers, env)
+            try:
+                result = run_load(port, bodies, args.concurrency)
+            finally:
+                server.terminate()
+                server.wait()
+            print(
+                f"{name:>6}: p50 {result['p50'] * 1000:8.1f}ms, "
+                f"p99 {result['p99'] * 1000:8.1f}ms, "
+                f"{result['throughput']:7.1f} requests/s, "
+                f"{result['rejected']} rejected"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Compares the previous search-based matching (a product index query_batch per
+line, scoring every hit) with ProductGraph.match_descriptions, for distinct
+lines, for heavily duplicated lines (exact copies, and copies differing only in
+casing, punctuation and spacing), and for adversarial lines made of common
+modifier words; and measures the peak memory of very large requests, computed
+in one batch or in chunks of QUERY_CHUNK_LINES.
+
+    python -m benchmarks.bench_dedupe --products 20000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import random
+import time
+import tracemalloc
+
+from benchmarks.generators import MODIFIERS, generate_hierarchy
+from benchmarks.generators import generate_ingredient_lines
+from web.ingredients import match_ingredients
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.preprocessing import strip_brackets_batch
+from web.result_cache import QUERY_CHUNK_LINES, ResultCache
+from web.tokenizer import tokenize
+
+
+def match_search(graph, descriptions, unadorned_descriptions):
+    # The previous implementation: each line is searched for individually, and
+    # every product found is scored
+    matches = {}
+    results = graph.product_index.query_batch(
+        descriptions, stopwords=graph.stopwords, query_limit=-1
+    )
+    for doc_id, (_, hits) in enumerate(results):
+        tokens = tokenize(unadorned_descriptions[doc_id], stemmer=Product.stemmer)
+        spans, score = graph.ngram_spans(tokens), 0
+        for hit in hits:
+            term = graph.name_terms[hit["doc_id"]]
+            if term in spans and len(term) > score:
+                view = graph.products_by_id.view(hit["doc_id"])
+                matches[doc_id] = view, [term], spans[term]
+                score = len(term)
+    return matches
+
+
+def vary(line, rng):
+    variants = [str.upper, str.title, lambda x: x.replace(" ", "  "), "{}!".format]
+    return rng.choice(variants)(line) if rng.random() < 0.5 else line
+
+
+def generate_workloads(hierarchy, lines, duplication, seed=0):
+    rng = random.Random(seed)
+    distinct = list(generate_ingredient_lines(hierarchy, lines, seed))
+    originals = distinct[: lines // duplication]
+    duplicated = [vary(rng.choice(originals), rng) for _ in range(lines)]
+    names = [record["product"] for record in hierarchy]
+    adversarial = [
+        f"{' '.join(rng.sample(MODIFIERS, 8))} {rng.choice(names)}"
+        for _ in range(lines)
+    ]
+    return {
+        "distinct": distinct,
+        "duplicated": duplicated,
+        "adversarial": adversarial,
+    }
+
+
+def measure(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def peak_memory(graph, descriptions, chunk_size):
+    cache = ResultCache("bench", max_entries=0, path=None)
+    tracemalloc.start()
+    cache.fetch(
+        "v1",
+        descriptions,
+        lambda misses: match_ingredients(graph, misses),
+        chunk_size,
+    )
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--duplication", type=int, default=10)
+    parser.add_argument("--large-lines", type=int, default=50000)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+
+    workloads = generate_workloads(hierarchy, args.lines, args.duplication)
+    for label, descriptions in workloads.items():
+        unadorned = [text for text, _ in strip_brackets_batch(descriptions)]
+        graph.match_descriptions(descriptions, unadorned)  # Warm the stemmer cache
+        search_seconds, expected = measure(match_search, graph, descriptions, unadorned)
+        current_seconds, actual = measure(
+            graph.match_descriptions, descriptions, unadorned
+        )
+
+        # Both paths must agree on the best match (and its span) per line
+        assert {k: (p.id, t, s) for k, (p, t, s) in expected.items()} == {
+            k: (p.id, t, s) for k, (p, t, s) in actual.items()
+        }
+        print(
+            f"{label:>12}: {len(set(descriptions)):>6} distinct lines, "
+            f"search {search_seconds / len(descriptions) * 1e6:7.1f}us/line, "
+            f"current {current_seconds / len(descriptions) * 1e6:7.1f}us/line "
+            f"({search_seconds / current_seconds:.1f}x)"
+        )
+
+    # A very large request, with results computed in a single batch, or in chunks
+    descriptions = list(generate_ingredient_lines(hierarchy, args.large_lines, 1))
+    for chunk_size in len(descriptions), QUERY_CHUNK_LINES:
+        seconds, peak = measure(peak_memory, graph, descriptions, chunk_size)
+        print(
+            f"{len(descriptions)} lines in chunks of {chunk_size:>6}: "
+            f"{seconds:5.2f}s, peak {peak / 2**20:6.1f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares ProductGraph.match_descriptions with and without the exact-match fast
+path, for ingredient lines that are (mostly) exactly a product name, and for
+lines that include quantities and preparation notes.
+
+    python -m benchmarks.bench_exact_match --products 20000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import random
+import time
+
+from benchmarks.generators import generate_hierarchy, generate_ingredient_lines
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.preprocessing import strip_brackets_batch
+
+
+def generate_name_lines(hierarchy, count, seed=0):
+    rng = random.Random(seed)
+    names = [record["product"] for record in hierarchy]
+    for _ in range(count):
+        name = rng.choice(names)
+        yield rng.choice([name, name + "s", name.title(), f"{name}, diced"])
+
+
+def match(graph, descriptions, exact_terms):
+    graph.exact_terms = exact_terms
+    unadorned = [text for text, _ in strip_brackets_batch(descriptions)]
+    started = time.perf_counter()
+    results = graph.match_descriptions(descriptions, unadorned)
+    return time.perf_counter() - started, {
+        doc_id: (p.id, terms, span) for doc_id, (p, terms, span) in results.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=10000)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+    exact_terms = graph.exact_terms
+    print(f"{len(exact_terms)} of {args.products} product names are exact keys")
+
+    workloads = {
+        "names": list(generate_name_lines(hierarchy, args.lines)),
+        "recipes": list(generate_ingredient_lines(hierarchy, args.lines)),
+    }
+    for workload, descriptions in workloads.items():
+        search, expected = match(graph, descriptions, {})
+        hits = graph.exact_match_hits
+        fast, actual = match(graph, descriptions, exact_terms)
+        hits = graph.exact_match_hits - hits
+
+        # The fast path must produce results identical to the search path
+        assert actual == expected
+        print(
+            f"{workload:>8}: search {search * 1000:8.1f}ms, "
+            f"fast path {fast * 1000:8.1f}ms ({search / fast:.1f}x), "
+            f"{hits / len(descriptions):.0%} of lines matched exactly"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures time-to-ready and peak RSS when building a product graph from a
+synthetic hierarchy served by a local stand-in for the backend service.
+
+    python -m benchmarks.bench_hierarchy --products 100000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+from benchmarks.generators import generate_hierarchy
+from benchmarks.hierarchy_server import HierarchyServer
+
+
+def retrieve_hierarchy_buffered(url):
+    # The previous implementation: buffer and decode the entire response first
+    from web.models.product import Product
+
+    with urlopen(url) as f:
+        text = f.read().decode("utf-8")
+
+    for line in text.splitlines():
+        product = json.loads(line)
+        yield Product(
+            id=product["id"],
+            name=product["product"],
+            frequency=product["recipe_count"],
+        )
+
+
+def run_child(mode, url):
+    from web.loader import HierarchyNotModified, retrieve_hierarchy
+    from web.models.product_graph import ProductGraph
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        if mode == "buffered":
+            graph = ProductGraph(retrieve_hierarchy_buffered(url))
+        else:
+            hierarchy = retrieve_hierarchy(url=url)
+            graph = ProductGraph(hierarchy)
+            graph.validators = hierarchy.validators
+    ready = time.perf_counter() - started
+
+    # Measure the cost of an hourly refresh when the hierarchy is unchanged
+    revalidated = None
+    if graph.validators:
+        started = time.perf_counter()
+        try:
+            with redirect_stdout(io.StringIO()):
+                retrieve_hierarchy(url=url, validators=graph.validators)
+        except HierarchyNotModified:
+            revalidated = time.perf_counter() - started
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "products": len(graph.products_by_id),
+                "ready_seconds": ready,
+                "revalidate_seconds": revalidated,
+                "peak_rss_mib": usage.ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "URL"))
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(*args.child)
+
+    server = HierarchyServer(generate_hierarchy(args.products)).start()
+    print(f"Serving {args.products} products ({len(server.body)} bytes)")
+
+    # Each mode runs in a fresh interpreter so that peak RSS is not shared
+    for mode in ("buffered", "streaming"):
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.bench_hierarchy"]
+            + ["--child", mode, server.url]
+        )
+        result = json.loads(output)
+        revalidate = result["revalidate_seconds"]
+        print(
+            f"{mode:>10}: ready in {result['ready_seconds']:.2f}s, "
+            f"peak RSS {result['peak_rss_mib']:.1f} MiB"
+            + (f", revalidated in {revalidate * 1000:.1f}ms" if revalidate else "")
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
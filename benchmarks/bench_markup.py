@@ -0,0 +1,134 @@
+"""
+Compares the per-line cost of rendering ingredient and direction markup with
+HashedIXSearch.highlight (which re-tokenizes and re-stems each description) and
+with the span-based renderer (which reuses the spans found during matching),
+and reports how many lines produce identical markup.
+
+    python -m benchmarks.bench_markup --products 20000 --lines 10000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import time
+
+from hashedixsearch import HashedIXSearch
+
+from benchmarks.generators import (
+    generate_direction_lines,
+    generate_hierarchy,
+    generate_ingredient_lines,
+)
+from web.directions import load_equipment_matcher, load_equipment_queries
+from web.markup import render_markup_batch
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.preprocessing import original_span, strip_brackets_batch
+from web.tokenizer import find_terms
+
+
+def measure(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def ingredient_workload(graph, lines):
+    stripped = strip_brackets_batch(lines)
+    matches = graph.match_descriptions(lines, [text for text, _ in stripped])
+    highlighter = HashedIXSearch(stemmer=Product.stemmer)
+
+    def legacy():
+        return [
+            highlighter.highlight(
+                doc=lines[doc_id], terms=terms, case_sensitive=False, limit=1
+            )
+            for doc_id, (_, terms, _) in matches.items()
+        ]
+
+    def current():
+        return render_markup_batch(
+            (lines[doc_id], [(*original_span(stripped[doc_id][1], span), None)])
+            for doc_id, (_, _, span) in matches.items()
+        )
+
+    return legacy, current
+
+
+def direction_workload(lines):
+    matcher, _ = load_equipment_matcher()
+    documents = []
+    for description in lines:
+        tokens = matcher.tokenize(description)
+        entities = matcher.entities(description, tokens)
+        if entities:
+            attributes = {
+                entity["term"]: {"class": f"{entity['type']} {entity['category']}"}
+                for entity in entities
+            }
+            documents.append((description, tokens, attributes))
+
+    def legacy():
+        return [
+            matcher.highlighter.highlight(
+                doc=description,
+                terms=list(attributes),
+                case_sensitive=False,
+                term_attributes=attributes,
+            )
+            for description, _, attributes in documents
+        ]
+
+    def current():
+        return render_markup_batch(
+            (
+                description,
+                [
+                    (start, end, attributes[term])
+                    for term, start, end in find_terms(tokens, attributes)
+                ],
+            )
+            for description, tokens, attributes in documents
+        )
+
+    return legacy, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--lines", type=int, default=10000)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+    queries = load_equipment_queries()
+    equipment = queries["appliance"] + queries["vessel"]
+
+    workloads = {
+        "ingredients": ingredient_workload(
+            graph, list(generate_ingredient_lines(hierarchy, args.lines))
+        ),
+        "directions": direction_workload(
+            list(generate_direction_lines(equipment, args.lines))
+        ),
+    }
+    for label, (legacy, current) in workloads.items():
+        legacy_seconds, expected = measure(legacy)
+        current_seconds, actual = measure(current)
+        identical = sum(a == b for a, b in zip(expected, actual))
+        count = len(expected)
+        print(
+            f"{label:>12}: highlight {legacy_seconds / count * 1e6:7.2f}us/line, "
+            f"spans {current_seconds / count * 1e6:7.2f}us/line "
+            f"({legacy_seconds / current_seconds:.1f}x), "
+            f"{identical}/{count} identical"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares the per-request description index (previous implementation) with
+ProductGraph.match_descriptions, for recipe-sized and bulk batches.
+
+    python -m benchmarks.bench_matching --products 20000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import time
+
+from hashedixsearch import HashedIXSearch
+
+from benchmarks.generators import generate_hierarchy, generate_ingredient_lines
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+
+
+def unadorn(description):
+    depth, output = 0, []
+    for char in description:
+        depth += char in "([{"
+        depth -= char in ")]}"
+        if not depth:
+            output.append(char)
+    return "".join(output)
+
+
+def match_legacy(graph, descriptions, unadorned_descriptions):
+    description_index = HashedIXSearch(stemmer=Product.stemmer)
+    for doc_id, description in enumerate(unadorned_descriptions):
+        description_index.add(doc_id, description)
+
+    candidates = graph.product_index.query_batch(
+        descriptions, stopwords=graph.stopwords, query_limit=-1
+    )
+    results, scores = {}, {}
+    for _, candidate_hits in candidates:
+        for candidate_hit in candidate_hits:
+            candidate = graph.products_by_id.view(candidate_hit["doc_id"])
+            for hit in description_index.query(candidate.name):
+                doc_id, score, terms = hit["doc_id"], hit["score"], hit["terms"]
+                if score > scores.get(doc_id, 0.0):
+                    results[doc_id] = candidate, terms
+                    scores[doc_id] = score
+    return results
+
+
+def match_lines(graph, descriptions, unadorned_descriptions):
+    # The previous implementation, applied to each description individually
+    results = {}
+    for doc_id, lines in enumerate(zip(descriptions, unadorned_descriptions)):
+        for _, match in match_legacy(graph, *([line] for line in lines)).items():
+            results[doc_id] = match
+    return results
+
+
+def measure(function, batches):
+    started = time.perf_counter()
+    for descriptions, unadorned_descriptions in batches:
+        function(descriptions, unadorned_descriptions)
+    return (time.perf_counter() - started) / len(batches)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+
+    for batch_size in (10, 30, 60, 10000):
+        repeat = args.repeat if batch_size < 1000 else 1
+        batches = []
+        for seed in range(repeat):
+            lines = list(generate_ingredient_lines(hierarchy, batch_size, seed))
+            batches.append((lines, [unadorn(line) for line in lines]))
+
+        # Both paths must agree on the best match (and highlight terms) per line
+        for descriptions, unadorned_descriptions in batches[:1]:
+            expected = match_lines(graph, descriptions, unadorned_descriptions)
+            actual = graph.match_descriptions(descriptions, unadorned_descriptions)
+            assert {k: (p.id, t) for k, (p, t) in expected.items()} == {
+                k: (p.id, t) for k, (p, t, _) in actual.items()
+            }
+
+        legacy = measure(lambda *batch: match_legacy(graph, *batch), batches)
+        current = measure(graph.match_descriptions, batches)
+        print(
+            f"{batch_size:>6} lines: legacy {legacy * 1000:9.1f}ms, "
+            f"single-pass {current * 1000:9.1f}ms ({legacy / current:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
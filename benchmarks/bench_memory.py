@@ -0,0 +1,88 @@
+"""
+Compares the memory used per product by the previous object-per-product layout
+(a dict of Product instances, indexed by string ids) and by the columnar
+ProductStore (indexed by integer ordinals).
+
+    python -m benchmarks.bench_memory --products 100000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import gc
+import io
+import tracemalloc
+
+from hashedixsearch import HashedIXSearch
+
+from benchmarks.generators import generate_hierarchy
+from web.models.product import Product
+from web.models.product_store import ProductStore
+
+
+def generate_products(count):
+    for record in generate_hierarchy(count):
+        yield Product(
+            id=record["id"], name=record["product"], frequency=record["recipe_count"]
+        )
+
+
+def build_objects(count):
+    products_by_id, product_docs = {}, {}
+    index = HashedIXSearch(stemmer=Product.stemmer)
+    stopwords = []
+    for product in generate_products(count):
+        product.stopwords = stopwords
+        doc = product.to_doc()
+        index.add(doc_id=product.id, doc=doc, count=product.frequency)
+        product_docs.setdefault(product.id, []).append((doc, product.frequency))
+        if product.id not in products_by_id:
+            products_by_id[product.id] = product
+        else:
+            products_by_id[product.id] += product
+    return (products_by_id, product_docs), index
+
+
+def build_columnar(count):
+    store = ProductStore()
+    index = HashedIXSearch(stemmer=Product.stemmer)
+    for product in generate_products(count):
+        product.stopwords = store.stopwords
+        doc = product.to_doc()
+        ordinal = store.add(product)
+        index.add(doc_id=ordinal, doc=doc, count=product.frequency)
+    return store, index
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        products, index = build(count)
+    gc.collect()
+    total = tracemalloc.get_traced_memory()[0]
+    del index
+    gc.collect()
+    products_only = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del products
+    return products_only, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Hierarchy records are generated within each measurement, so that the
+    # strings retained from them are included in the totals
+    count = args.products
+    for label, build in (("objects", build_objects), ("columnar", build_columnar)):
+        products_only, total = measure(build, count)
+        print(
+            f"{label:>9}: {products_only / count:6.0f} bytes/product (products), "
+            f"{total / count:6.0f} bytes/product (products and index)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares the previous character-by-character parenthesis filter with the
+bracket scanner used to preprocess ingredient descriptions.
+
+    python -m benchmarks.bench_preprocessing --lines 100000
+"""
+
+import argparse
+from collections import Counter
+import time
+
+from benchmarks.generators import generate_hierarchy, generate_ingredient_lines
+from web.preprocessing import strip_brackets_batch
+
+
+def strip_brackets_legacy(descriptions):
+    unadorned_descriptions = []
+    for description in descriptions:
+        parens, unadorned_description = Counter(), ""
+        for char in description:
+            if char in {"(", "[", "{"}:
+                parens[char] += 1
+            if char in {")", "]", "}"}:
+                parens[char] -= 1
+            if not parens.total():
+                unadorned_description += char
+        unadorned_descriptions.append(unadorned_description)
+    return unadorned_descriptions
+
+
+def measure(function, descriptions):
+    started = time.perf_counter()
+    function(descriptions)
+    return (time.perf_counter() - started) / len(descriptions)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100000)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(10000))
+    lines = list(generate_ingredient_lines(hierarchy, args.lines))
+    workloads = {
+        "recipe lines": lines,
+        "long lines": [f"{line} ({line}, or {line} [{line}])" for line in lines],
+    }
+    for label, descriptions in workloads.items():
+        legacy = measure(strip_brackets_legacy, descriptions)
+        current = measure(strip_brackets_batch, descriptions)
+        print(
+            f"{label:>12}: legacy {legacy * 1e6:6.2f}us/line, "
+            f"scanner {current * 1e6:6.2f}us/line ({legacy / current:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Compares is-a, descendant and substitute queries against the compact relation
+store (ProductRelations) with traversals of per-product parent, child and
+substitute mappings, at catalogue scale; and measures the batch relation
+endpoints.
+
+    python -m benchmarks.bench_relations --products 100000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import random
+import time
+import tracemalloc
+
+from benchmarks.generators import add_relations, generate_hierarchy
+from web.app import app
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.models.product_relations import ProductRelations
+
+
+def measure(function, queries):
+    started = time.perf_counter()
+    results = [function(*query) for query in queries]
+    return (time.perf_counter() - started) / len(queries), results
+
+
+def build_mappings(records):
+    parents, children, substitutes = {}, {}, {}
+    for record in records:
+        if record["id"] in parents:
+            continue
+        parents[record["id"]] = record["parent_id"]
+        children.setdefault(record["parent_id"], []).append(record["id"])
+        substitutes[record["id"]] = record["substitutes"]
+    return parents, children, substitutes
+
+
+def is_a_traversal(parents, product_id, ancestor_id):
+    while product_id is not None:
+        if product_id == ancestor_id:
+            return True
+        product_id = parents[product_id]
+    return False
+
+
+def descendants_traversal(children, product_id):
+    descendants, stack = [], list(reversed(children.get(product_id, [])))
+    while stack:
+        product_id = stack.pop()
+        descendants.append(product_id)
+        stack.extend(reversed(children.get(product_id, [])))
+    return descendants
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=100000)
+    parser.add_argument("--parent-skew", type=float, default=2.0)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    records = add_relations(hierarchy, parent_skew=args.parent_skew)
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(
+                id=r["id"],
+                name=r["product"],
+                frequency=r["recipe_count"],
+                parent_id=r["parent_id"],
+                substitutes=r["substitutes"],
+            )
+            for r in records
+        )
+    store = graph.products_by_id
+
+    relations = [(r["id"], r["parent_id"], r["substitutes"]) for r in records]
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        relation_store = ProductRelations.build(
+            store.ordinals, len(store.ids), relations
+        )
+    build_seconds = time.perf_counter() - started
+    size = sum(
+        len(getattr(relation_store, name)) * 8 for name in ProductRelations.SECTIONS
+    )
+    depth = sum(len(relation_store.ancestors(o)) for o in range(len(store.ids)))
+    print(
+        f"build: {build_seconds:.2f}s, {size / 2**20:.1f}MiB, "
+        f"mean depth {depth / len(store.ids):.1f}"
+    )
+
+    tracemalloc.start()
+    parents, children, substitutes = build_mappings(records)
+    mappings_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"mappings: {mappings_size / 2**20:.1f}MiB")
+    rng = random.Random(0)
+    product_ids = list(store)
+    pairs = [
+        (rng.choice(product_ids), rng.choice(product_ids[:100]))
+        for _ in range(args.queries)
+    ]
+    singles = [(rng.choice(product_ids),) for _ in range(args.queries // 10)]
+    workloads = {
+        "is-a": (
+            pairs,
+            lambda x, y: is_a_traversal(parents, x, y),
+            lambda x, y: graph.relations.is_a(store.ordinal(x), store.ordinal(y)),
+        ),
+        "descendants": (
+            singles,
+            lambda x: descendants_traversal(children, x),
+            lambda x: [
+                store.ids[o] for o in graph.relations.descendants(store.ordinal(x))
+            ],
+        ),
+        "substitutes": (
+            singles,
+            lambda x: list(substitutes[x]),
+            lambda x: [
+                store.ids[o]
+                for o in graph.relations.substitute_ordinals(store.ordinal(x))
+            ],
+        ),
+    }
+    for label, (queries, traversal, compact) in workloads.items():
+        expected_seconds, expected = measure(traversal, queries)
+        actual_seconds, actual = measure(compact, queries)
+        if label == "descendants":
+            expected = [sorted(result) for result in expected]
+            actual = [sorted(result) for result in actual]
+        assert actual == expected, label
+        print(
+            f"{label:>12}: traversal {expected_seconds * 1e6:8.2f}us/query, "
+            f"compact {actual_seconds * 1e6:8.2f}us/query "
+            f"({expected_seconds / actual_seconds:.1f}x)"
+        )
+
+    # Batch endpoints, for 500 products (and 10 candidate ancestors)
+    app.graph_manager.graph = graph
+    client = app.test_client()
+    batch = {"ids[]": product_ids[-500:], "ancestor_ids[]": product_ids[:10]}
+    for path in "/relations/is-a", "/relations/ancestors", "/relations/substitutes":
+        started = time.perf_counter()
+        for _ in range(20):
+            assert client.post(path, data=batch).status_code == 200
+        elapsed = (time.perf_counter() - started) / 20
+        print(f"{path:>24}: {elapsed * 1000:6.1f}ms per 500-product batch")
+
+
+if __name__ == "__main__":
+    main()
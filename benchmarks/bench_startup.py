@@ -0,0 +1,75 @@
+"""
+Reports the cold-start cost of the application: the import time of each module
+(from `python -X importtime`), and the time until the first direction query
+and metrics request are served, each measured in a fresh interpreter.
+
+    python -m benchmarks.bench_startup --top 15
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+FIRST_REQUEST = """
+import json
+from web.app import app
+
+client = app.test_client()
+response = client.post("/directions/query", data={"descriptions[]": ["{line}"]})
+assert response.status_code == 200, response.status_code
+print(json.dumps(app.startup))
+"""
+
+
+def import_times():
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import web.app"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    # Lines have the form "import time: self [us] | cumulative | module", where
+    # the module name is indented by its depth in the import tree
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(cumulative) / 1e6, depth, name.strip()))
+    return modules
+
+
+def first_request(line):
+    started = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, "-c", FIRST_REQUEST.replace("{line}", line)]
+    )
+    elapsed = time.perf_counter() - started
+    return json.loads(output.splitlines()[-1]), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    modules = import_times()
+    total = sum(seconds for seconds, depth, _ in modules if depth == 0)
+    print(f"Imported {len(modules)} modules in {total:.3f}s; slowest (cumulative):")
+    for seconds, _, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"  {seconds:8.3f}s  {name}")
+
+    startup, elapsed = first_request("place casserole dish in oven")
+    print(
+        f"Application imported in {startup['import_seconds']:.3f}s; "
+        f"first request served after {startup['first_request_seconds']:.3f}s "
+        f"({elapsed:.3f}s including interpreter startup)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures the overhead of ranking the top-k products per line
+(ProductGraph.rank_descriptions) over selecting the single best match
+(ProductGraph.match_descriptions), for recipe-sized and bulk batches.
+
+    python -m benchmarks.bench_top_k --products 20000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import time
+
+from benchmarks.generators import generate_hierarchy, generate_ingredient_lines
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.preprocessing import strip_brackets_batch
+
+
+def measure(function, batches):
+    started = time.perf_counter()
+    for batch in batches:
+        function(*batch)
+    return (time.perf_counter() - started) / len(batches)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    hierarchy = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(
+            Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+            for r in hierarchy
+        )
+
+    for batch_size in (30, 10000):
+        repeat = args.repeat if batch_size < 1000 else 1
+        batches = []
+        for seed in range(repeat):
+            lines = list(generate_ingredient_lines(hierarchy, batch_size, seed))
+            batches.append((lines, strip_brackets_batch(lines)))
+
+        # The top-ranked unbracketed product is the single best match
+        for descriptions, stripped in batches[:1]:
+            unadorned = [text for text, _ in stripped]
+            expected = graph.match_descriptions(descriptions, unadorned)
+            ranked = graph.rank_descriptions(descriptions, stripped, 1)
+            assert {k: p.id for k, (p, *_) in expected.items()} == {
+                k: r[0]["product"].id
+                for k, r in ranked.items()
+                if not r[0]["bracketed"]
+            }
+
+        best = measure(
+            lambda descriptions, stripped: graph.match_descriptions(
+                descriptions, [text for text, _ in stripped]
+            ),
+            batches,
+        )
+        timings = []
+        for top_k in (1, 5, 20):
+            ranked = measure(
+                lambda descriptions, stripped: graph.rank_descriptions(
+                    descriptions, stripped, top_k
+                ),
+                batches,
+            )
+            timings.append(f"k={top_k} {ranked * 1000:8.1f}ms ({ranked / best:.2f}x)")
+        print(
+            f"{batch_size:>6} lines: best {best * 1000:8.1f}ms, " + ", ".join(timings)
+        )
+
+
+if __name__ == "__main__":
+    main()
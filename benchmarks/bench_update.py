@@ -0,0 +1,74 @@
+"""
+Compares the cost of refreshing a product graph by applying the changes between
+two synthetic hierarchies (ProductGraph.update) with building a new graph, for
+increasing numbers of changed products.
+
+    python -m benchmarks.bench_update --products 50000 --changes 10,100,1000
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import random
+import time
+
+from benchmarks.generators import generate_hierarchy
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+
+
+def to_products(records):
+    return [
+        Product(id=r["id"], name=r["product"], frequency=r["recipe_count"])
+        for r in records
+    ]
+
+
+def modify_hierarchy(records, changes, seed=0):
+    # Re-weights, renames, removes and appends products in equal proportion
+    rng = random.Random(seed)
+    records = [dict(record) for record in records]
+    for index in rng.sample(range(len(records)), changes):
+        action = index % 4
+        if action == 0:
+            records[index]["recipe_count"] += rng.randint(1, 100)
+        elif action == 1:
+            records[index]["product"] = "fresh " + records[index]["product"]
+        elif action == 2:
+            records[index] = None
+        else:
+            records.append({**records[index], "id": f"new_{index}"})
+    return [record for record in records if record]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--changes", default="10,100,1000")
+    args = parser.parse_args()
+
+    records = list(generate_hierarchy(args.products))
+    with redirect_stdout(io.StringIO()):
+        graph = ProductGraph(to_products(records))
+
+    for changes in map(int, args.changes.split(",")):
+        updated = to_products(modify_hierarchy(records, changes))
+        with redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = graph.update(updated)
+            update_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            expected = ProductGraph(updated)
+            build_seconds = time.perf_counter() - started
+
+        assert result.version == expected.version
+        assert len(result.products_by_id) == len(expected.products_by_id)
+        print(
+            f"{changes:>6} changes: update {update_seconds:7.2f}s, "
+            f"rebuild {build_seconds:7.2f}s ({build_seconds / update_seconds:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import random
+
+ONSETS = ["b", "br", "c", "ch", "d", "f", "g", "gr", "k", "l", "m", "n", "p", "r"]
+ONSETS += ["s", "sh", "sp", "st", "t", "tr", "v", "w", "z"]
+VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "oo"]
+CODAS = ["", "", "n", "r", "s", "t", "ck", "ll", "sh", "ng"]
+
+MODIFIERS = ["red", "green", "black", "white", "sweet", "smoked", "dried", "fresh"]
+MODIFIERS += ["ground", "whole", "baby", "wild", "frozen", "pickled", "roasted"]
+
+
+def generate_word(rng):
+    syllables = rng.randint(1, 3)
+    return "".join(
+        rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+        for _ in range(syllables)
+    )
+
+
+def generate_hierarchy(count, seed=0, duplicate_ratio=0.02):
+    rng = random.Random(seed)
+    nouns = [generate_word(rng) for _ in range(max(count // 4, 10))]
+
+    emitted = []
+    for rank in range(1, count + 1):
+        # Occasionally re-emit an earlier product id under a different name, as
+        # the backend does for products with multiple spellings
+        if emitted and rng.random() < duplicate_ratio:
+            product_id, name = rng.choice(emitted)
+            name = f"{rng.choice(MODIFIERS)} {name}"
+        else:
+            words = [rng.choice(nouns)]
+            for _ in range(rng.choice([0, 0, 0, 1, 1, 2])):
+                words.insert(0, rng.choice(MODIFIERS + nouns))
+            name = " ".join(words)
+            product_id = name.replace(" ", "_") + f"_{rank}"
+            emitted.append((product_id, name))
+
+        yield {
+            "id": product_id,
+            "product": name,
+            # Recipe counts follow a long-tailed distribution, as in production
+            "recipe_count": int(100000 / rank**1.1) + rng.randint(0, 3),
+        }
+
+
+def add_relations(
+    hierarchy, seed=0, root_ratio=0.01, substitute_ratio=0.2, parent_skew=2.0
+):
+    # Assigns each product a parent among the products that precede it, and
+    # occasionally some substitutes; parents are skewed towards the earliest
+    # products, so that larger skews produce broader and shallower hierarchies
+    rng = random.Random(seed)
+    product_ids = list(dict.fromkeys(record["id"] for record in hierarchy))
+    relations = {}
+    for index, product_id in enumerate(product_ids):
+        parent_id = None
+        if index and rng.random() > root_ratio:
+            parent_id = product_ids[int(index * rng.random() ** parent_skew)]
+        substitutes = []
+        if rng.random() < substitute_ratio:
+            substitutes = rng.sample(product_ids, rng.randint(1, 3))
+        relations[product_id] = {"parent_id": parent_id, "substitutes": substitutes}
+    return [dict(record, **relations[record["id"]]) for record in hierarchy]
+
+
+def generate_ingredient_lines(hierarchy, count, seed=0):
+    rng = random.Random(seed)
+    quantities = ["1", "2", "250g", "1 cup", "3 tbsp", "a pinch of", "1 large"]
+    preparations = ["", ", diced", ", sliced", " (optional)", ", to taste"]
+    names = [record["product"] for record in hierarchy]
+    for _ in range(count):
+        name = rng.choice(names)
+        yield f"{rng.choice(quantities)} {name}{rng.choice(preparations)}"
+
+
+def generate_direction_lines(equipment, count, seed=0):
+    rng = random.Random(seed)
+    verbs = ["place", "heat", "stir", "pour", "transfer", "bake", "whisk", "leave"]
+    fillers = ["the mixture", "the onions", "for 10 minutes", "until golden"]
+    for _ in range(count):
+        words = [rng.choice(verbs), rng.choice(fillers), "in the"]
+        words.append(rng.choice(equipment))
+        if rng.random() < 0.5:
+            words += ["and then the", rng.choice(equipment)]
+        yield " ".join(words)
@@ -0,0 +1,67 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+
+class HierarchyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, records, address=("127.0.0.1", 0)):
+        self.body = b"".join(json.dumps(record).encode() + b"\n" for record in records)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+        self.requests = 0
+        super().__init__(address, HierarchyRequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/products/hierarchy"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class HierarchyRequestHandler(BaseHTTPRequestHandler):
+    chunk_size = 64 * 1024
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.end_headers()
+            return
+
+        body = self.server.body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        chunk_size = self.chunk_size
+        for offset in range(0, len(body), chunk_size):
+            end = offset + chunk_size
+            self.wfile.write(body[offset:end])
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from benchmarks.generators import generate_hierarchy
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    server = HierarchyServer(
+        generate_hierarchy(args.products), address=("127.0.0.1", args.port)
+    )
+    print(f"Serving {args.products} products at {server.url}")
+    server.serve_forever()
@@ -0,0 +1,234 @@
+"""
+Runs the benchmark suite against synthetic data at one or more scales, and
+compares the results with a stored baseline; exits with a non-zero status if
+any measurement regresses by more than the threshold.
+
+    python -m benchmarks.suite --scale small --scale medium
+    python -m benchmarks.suite --scale small --update-baseline
+
+Each scale runs in a fresh interpreter: the product graph is built from a local
+stand-in for the backend hierarchy endpoint, and recipe-sized ingredient and
+direction queries are then posted to the Flask application (with result
+caching disabled).  Baselines are machine-specific; regenerate them when
+benchmarking on different hardware.
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.generators import (
+    generate_direction_lines,
+    generate_hierarchy,
+    generate_ingredient_lines,
+)
+from benchmarks.hierarchy_server import HierarchyServer
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SCALES = {
+    "small": {"products": 2000, "recipes": 500},
+    "medium": {"products": 20000, "recipes": 500},
+    "large": {"products": 100000, "recipes": 500},
+}
+LINES_PER_RECIPE = 15
+WARMUP_RECIPES = 50
+ROUNDS = 3
+CONFIRMATION_RUNS = 2
+
+# Throughput measurements improve as they increase; all others as they decrease
+HIGHER_IS_BETTER = {"ingredients_lines_per_second", "directions_lines_per_second"}
+
+# Each round's 99th percentile latency is one of its slowest few requests, and
+# varies too much between runs to share the threshold of the other measurements
+TAIL_LATENCIES = {"ingredients_p99_ms", "directions_p99_ms"}
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure_queries(client, path, recipes):
+    # Requests made shortly after startup populate the stemmer cache
+    for descriptions in recipes[:WARMUP_RECIPES]:
+        client.post(path, data={"descriptions[]": descriptions})
+
+    latencies = []
+    started = time.perf_counter()
+    for descriptions in recipes:
+        request_started = time.perf_counter()
+        response = client.post(path, data={"descriptions[]": descriptions})
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - request_started)
+    duration = time.perf_counter() - started
+    return {
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "lines_per_second": sum(len(recipe) for recipe in recipes) / duration,
+    }
+
+
+def run_scale(scale):
+    from web.app import app
+    from web.directions import direction_cache, load_equipment_queries
+    from web.ingredients import ingredient_cache
+    from web.loader import retrieve_hierarchy
+    from web.models.product import Product
+    from web.models.product_graph import ProductGraph
+
+    products, recipes = SCALES[scale]["products"], SCALES[scale]["recipes"]
+    records = list(generate_hierarchy(products))
+    server = HierarchyServer(records).start()
+
+    # The one-off import of the inflection library is a startup cost, rather
+    # than a cost of building the graph
+    Product.get_inflector()
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        hierarchy = retrieve_hierarchy(url=server.url)
+        graph = ProductGraph(hierarchy)
+    build_seconds = time.perf_counter() - started
+    server.shutdown()
+
+    app.graph_manager.graph = graph
+    ingredient_cache.max_entries = direction_cache.max_entries = 0
+    client = app.test_client()
+
+    queries = load_equipment_queries()
+    equipment = queries["appliance"] + queries["vessel"]
+    workloads = {
+        "ingredients": [
+            list(generate_ingredient_lines(records, LINES_PER_RECIPE, seed))
+            for seed in range(recipes)
+        ],
+        "directions": [
+            list(generate_direction_lines(equipment, LINES_PER_RECIPE, seed))
+            for seed in range(recipes)
+        ],
+    }
+
+    # Query measurements report the best of several rounds, since latency
+    # percentiles are sensitive to transient load on the benchmarking host
+    results = {"build_seconds": build_seconds}
+    for endpoint, workload in workloads.items():
+        rounds = [
+            measure_queries(client, f"/{endpoint}/query", workload)
+            for _ in range(ROUNDS)
+        ]
+        for name in rounds[0]:
+            best = max if f"{endpoint}_{name}" in HIGHER_IS_BETTER else min
+            results[f"{endpoint}_{name}"] = best(r[name] for r in rounds)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    results["peak_rss_mib"] = usage.ru_maxrss / 1024
+    print(json.dumps(results))
+
+
+def run_child(scale):
+    # Each scale runs in a fresh interpreter so that peak RSS is not shared; the
+    # application logs to stdout, so the results are its last line
+    output = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.suite", "--child", scale]
+    )
+    return json.loads(output.splitlines()[-1])
+
+
+def best_results(*runs):
+    return {
+        name: (max if name in HIGHER_IS_BETTER else min)(run[name] for run in runs)
+        for name in runs[0]
+    }
+
+
+def compare(results, baseline, threshold, tail_threshold):
+    regressions = []
+    for name, value in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if name in HIGHER_IS_BETTER:
+            change = (expected - value) / expected
+        else:
+            change = (value - expected) / expected
+        if change > (tail_threshold if name in TAIL_LATENCIES else threshold):
+            regressions.append((name, expected, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", action="append", choices=SCALES)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("BENCHMARK_THRESHOLD", 0.25)),
+        help="the fractional change that is reported as a regression",
+    )
+    parser.add_argument(
+        "--tail-threshold",
+        type=float,
+        default=float(os.environ.get("BENCHMARK_TAIL_THRESHOLD", 1.0)),
+        help="the fractional change in p99 latency reported as a regression",
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--child", choices=SCALES)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_scale(args.child)
+
+    try:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    failed = False
+    for scale in args.scale or ["small"]:
+        results = run_child(scale)
+        baseline = baselines.get(scale, {})
+
+        # Load on the benchmarking host can slow a whole run; apparent
+        # regressions are only reported if further runs confirm them
+        for _ in range(CONFIRMATION_RUNS):
+            if args.update_baseline or not compare(
+                results, baseline, args.threshold, args.tail_threshold
+            ):
+                break
+            print(f"{scale}: re-running to confirm regressions")
+            results = best_results(results, run_child(scale))
+
+        print(f"{scale}:")
+        for name, value in results.items():
+            expected = baseline.get(name)
+            reference = f" (baseline {expected:.2f})" if expected else ""
+            print(f"  {name:>30}: {value:10.2f}{reference}")
+
+        if args.update_baseline:
+            baselines[scale] = results
+            continue
+        regressions = compare(results, baseline, args.threshold, args.tail_threshold)
+        for name, expected, value, change in regressions:
+            print(
+                f"  REGRESSION {name}: {value:.2f} vs baseline {expected:.2f} "
+                f"({change:+.0%})"
+            )
+            failed = True
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
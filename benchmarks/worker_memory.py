@@ -0,0 +1,60 @@
+"""
+Reports resident (RSS), proportional (PSS) and unique (USS) memory for a
+gunicorn master process and each of its workers, read from /proc (Linux only).
+
+Unique memory is the memory that would be freed if that process exited; it is
+the per-worker cost of adding another worker.
+
+    python -m benchmarks.worker_memory [MASTER_PID]
+"""
+
+import os
+import sys
+
+
+def read_rollup(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def read_children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def find_master():
+    for pid in sorted(int(entry) for entry in os.listdir("/proc") if entry.isdigit()):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().split(b"\0")
+        except OSError:
+            continue
+        if any(b"gunicorn" in arg for arg in cmdline[:2]) and read_children(pid):
+            return pid
+    raise SystemExit("No gunicorn master process found")
+
+
+def main():
+    master = int(sys.argv[1]) if len(sys.argv) > 1 else find_master()
+    workers = read_children(master)
+
+    print(f"{'process':>16} {'RSS MiB':>9} {'PSS MiB':>9} {'USS MiB':>9}")
+    for label, pid in [("master", master)] + [("worker", pid) for pid in workers]:
+        usage = read_rollup(pid)
+        print(
+            f"{label:>8} {pid:>7} "
+            + " ".join(f"{usage[key] / 1024:9.1f}" for key in ("rss", "pss", "uss"))
+        )
+
+
+if __name__ == "__main__":
+    main()
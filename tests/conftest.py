@@ -6,3 +6,9 @@ from web.app import app
 @pytest.fixture
 def client():
     return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def reset_graph():
+    # Each test loads the product graph afresh from its own (mock) hierarchy
+    app.graph_manager.graph = None
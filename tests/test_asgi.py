@@ -0,0 +1,129 @@
+import asyncio
+from urllib.parse import urlencode
+
+import web.asgi
+from web.asgi import MicroBatcher
+import web.bulk
+
+
+async def call(path, method="POST", body=b"", content_type=None):
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    headers = [(b"content-type", content_type.encode())] if content_type else []
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": headers,
+    }
+    await web.asgi.app(scope, receive, send)
+
+    status = sent[0]["status"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return status, dict(sent[0]["headers"]), body
+
+
+def form(descriptions):
+    return urlencode({"descriptions[]": descriptions}, doseq=True).encode()
+
+
+def test_direction_query(client):
+    descriptions = ["place casserole dish in oven", "empty skewer into the karahi"]
+    expected = client.post("/directions/query", data={"descriptions[]": descriptions})
+
+    status, headers, body = asyncio.run(
+        call(
+            "/directions/query",
+            body=form(descriptions),
+            content_type="application/x-www-form-urlencoded",
+        )
+    )
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    assert body == expected.data
+
+
+def test_micro_batching():
+    batches = []
+
+    def process(batch):
+        batches.append(batch)
+        return [len(descriptions) for descriptions in batch]
+
+    async def submit():
+        batcher = MicroBatcher(process, window=0.01)
+        return await asyncio.gather(
+            batcher.submit(["a"]), batcher.submit(["b", "c"]), batcher.submit([])
+        )
+
+    assert asyncio.run(submit()) == [1, 2, 0]
+    assert batches == [[["a"], ["b", "c"], []]]
+
+
+def test_backpressure(monkeypatch):
+    monkeypatch.setattr(web.asgi, "ASGI_MAX_PENDING", 0)
+
+    status, headers, _ = asyncio.run(
+        call(
+            "/directions/query",
+            body=form(["stir"]),
+            content_type="application/x-www-form-urlencoded",
+        )
+    )
+
+    assert status == 429
+    assert headers[b"retry-after"] == b"1"
+
+
+def test_streamed_bulk_query(monkeypatch):
+    monkeypatch.setattr(web.bulk, "BULK_CHUNK_SIZE", 1)
+    chunks = [b'["stir"]\n', b'["place casserole dish in oven"]\n']
+    sent = []
+
+    async def bulk():
+        responded = asyncio.Event()
+
+        async def receive():
+            body = chunks.pop(0)
+            if not chunks:
+                # The last line is only sent once the first has been answered
+                await asyncio.wait_for(responded.wait(), timeout=5)
+            return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body"):
+                responded.set()
+
+        headers = [(b"content-type", b"application/x-ndjson")]
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/directions/bulk",
+            "query_string": b"",
+            "headers": headers,
+        }
+        await web.asgi.app(scope, receive, send)
+
+    asyncio.run(bulk())
+
+    assert sent[0]["status"] == 200
+    lines = b"".join(message.get("body", b"") for message in sent[1:]).splitlines()
+    assert len(lines) == 2
+    assert b"casserole dish" in lines[1]
+
+
+def test_flask_routes():
+    status, _, body = asyncio.run(call("/metrics", method="GET"))
+
+    assert status == 200
+    assert b"knowledge_graph_stage_duration_seconds" in body
@@ -38,3 +38,30 @@ def test_description_parsing(client):
         entity_names = [entity["name"] for entity in result["entities"]]
         assert description in description_entities
         assert entity_names == description_entities[description]
+
+
+def test_equipment_spans():
+    from web.directions import load_equipment_matcher
+
+    equipment_matcher, _ = load_equipment_matcher()
+    description = "Place the casserole dish in the Slow Cooker"
+    matches = list(equipment_matcher.scan(description))
+
+    spans = {match["name"]: match["span"] for match in matches}
+    assert description[slice(*spans["casserole dish"])] == "casserole dish"
+    assert description[slice(*spans["slow cooker"])] == "Slow Cooker"
+    assert {match["category"] for match in matches} == {"vessel", "appliance"}
+
+
+def test_description_bulk_parsing(client):
+    recipes = [
+        ["Pre-heat the oven to 250 degrees F.", "place casserole dish in oven"],
+        ["empty skewer into the karahi"],
+    ]
+    expected = [
+        client.post("/directions/query", data={"descriptions[]": recipe}).data
+        for recipe in recipes
+    ]
+
+    response = client.post("/directions/bulk", json=recipes)
+    assert response.data.splitlines(keepends=True) == expected
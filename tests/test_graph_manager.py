@@ -0,0 +1,53 @@
+import pytest
+
+from web.graph_manager import GraphManager
+
+
+class FlakyLoader:
+    def __init__(self, results):
+        self.results = list(results)
+
+    def __call__(self, previous):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_initial_load_failure():
+    manager = GraphManager(loader=FlakyLoader([ValueError("backend down")]))
+
+    with pytest.raises(RuntimeError):
+        manager.ensure_loaded()
+
+    assert manager.graph is None
+    assert manager.stats()["failures"] == 1
+
+
+def test_keep_last_good_graph():
+    manager = GraphManager(loader=FlakyLoader(["v1", ValueError("error"), "v2"]))
+
+    assert manager.refresh() is True
+    assert manager.graph == "v1"
+
+    assert manager.refresh() is False
+    assert manager.graph == "v1"
+    assert "error" in manager.stats()["last_error"]
+
+    assert manager.refresh() is True
+    assert manager.graph == "v2"
+
+    stats = manager.stats()
+    assert stats["builds"] == 2
+    assert stats["failures"] == 1
+    assert stats["last_error"] is None
+    assert stats["graph_age_seconds"] >= 0
+
+
+def test_refresh_jitter():
+    manager = GraphManager(loader=None, refresh_interval=100, jitter=0.2)
+
+    delays = [manager.next_refresh_delay() for _ in range(100)]
+
+    assert all(80 <= delay <= 120 for delay in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,19 @@
+import gc
+from unittest.mock import Mock
+
+from web import gunicorn_config
+from web.app import app
+from web.directions import load_equipment_matcher
+
+
+def test_shared_state_built_before_fork(monkeypatch):
+    monkeypatch.setattr(app.graph_manager, "refresh", lambda: True)
+    load_equipment_matcher.cache_clear()
+
+    try:
+        gunicorn_config.when_ready(Mock())
+    finally:
+        gc.unfreeze()
+
+    # Workers forked from the master share its equipment matcher
+    assert load_equipment_matcher.cache_info().currsize == 1
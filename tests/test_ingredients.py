@@ -1,8 +1,36 @@
+import json
+import time
 from unittest.mock import patch
 
+from web.instrumentation import stage_duration
+from web.loader import HierarchyStream
 from web.models.product import Product
 
 
+class SlowResponse:
+    headers = {}
+
+    def __init__(self, lines, delay):
+        self.lines = lines
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __iter__(self):
+        for line in self.lines:
+            time.sleep(self.delay)
+            yield line
+
+
+def stage_seconds(stage):
+    series = stage_duration.series.get((("stage", stage),))
+    return series[1] if series else 0
+
+
 @patch("web.ingredients.retrieve_hierarchy")
 @patch("web.ingredients.retrieve_stopwords")
 def test_ingredient_query(stopwords, hierarchy, client):
@@ -87,3 +115,137 @@ def test_ingredient_query(stopwords, hierarchy, client):
         assert results[query]["product"]["id"] == expected["product_id"]
         assert results[query]["product"]["product"] == expected["product"]
         assert results[query]["query"]["markup"] == expected["markup"]
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_ingredient_bulk_query(stopwords, hierarchy, client):
+    stopwords.return_value = []
+    hierarchy.return_value = [
+        Product(id="onion", name="onion", frequency=10),
+        Product(id="tofu", name="tofu", frequency=20),
+        Product(id="firm_tofu", name="firm tofu"),
+        Product(id="soy_milk", name="soy milk", frequency=5),
+    ]
+
+    recipes = [
+        ["large onion, diced", "block of firm tofu"],
+        ["250ml of soy milk (roughly one cup)", "tofu", "water"],
+        [],
+    ]
+    expected = [
+        client.post("/ingredients/query", data={"descriptions[]": recipe}).data
+        for recipe in recipes
+    ]
+
+    response = client.post("/ingredients/bulk", json=recipes)
+    assert response.mimetype == "application/x-ndjson"
+    assert response.data.splitlines(keepends=True) == expected
+
+    body = "".join(json.dumps({"descriptions": recipe}) + "\n" for recipe in recipes)
+    response = client.post(
+        "/ingredients/bulk", data=body, content_type="application/x-ndjson"
+    )
+    assert response.data.splitlines(keepends=True) == expected
+
+    # Invalid lines produce an error result, and the remaining lines are served
+    lines = body.splitlines(keepends=True)
+    body = "".join([lines[0], "{not json\n", '{"descriptions": "tofu"}\n', lines[1]])
+    response = client.post(
+        "/ingredients/bulk", data=body, content_type="application/x-ndjson"
+    )
+    assert response.status_code == 200
+    results = response.data.splitlines(keepends=True)
+    assert results[0] == expected[0] and results[3] == expected[1]
+    assert json.loads(results[1])["line"] == 2
+    assert json.loads(results[2]) == {
+        "line": 3,
+        "error": "Expected a list of descriptions",
+    }
+    response = client.post("/ingredients/bulk", json=[["tofu"], "tofu"])
+    assert response.status_code == 400
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_ingredient_top_k_query(stopwords, hierarchy, client):
+    stopwords.return_value = []
+    hierarchy.return_value = [
+        Product(id="onion", name="onion", frequency=10),
+        Product(id="tofu", name="tofu", frequency=20),
+        Product(id="firm_tofu", name="firm tofu"),
+        Product(id="soft_tofu", name="soft tofu"),
+        Product(id="silken_tofu", name="silken tofu"),
+    ]
+    descriptions = [
+        "tofu (soft tofu or silken tofu is best)",
+        "block of firm tofu",
+        "water",
+    ]
+
+    single = client.post("/ingredients/query", data={"descriptions[]": descriptions})
+    ranked = client.post(
+        "/ingredients/query", data={"descriptions[]": descriptions, "top_k": 2}
+    )
+
+    # The best match is unchanged, and alternatives are listed in rank order
+    for description in descriptions:
+        result = ranked.json["results"][description]
+        assert result["product"] == single.json["results"][description]["product"]
+        assert result["query"] == single.json["results"][description]["query"]
+
+    matches = ranked.json["results"][descriptions[0]]["matches"]
+    assert [match["product"]["id"] for match in matches] == ["tofu", "soft_tofu"]
+    assert [match["span"] for match in matches] == [[0, 4], [6, 15]]
+    assert matches[0]["score"] == 1.0
+
+    matches = ranked.json["results"][descriptions[1]]["matches"]
+    assert [match["product"]["id"] for match in matches] == ["firm_tofu", "tofu"]
+    assert [match["span"] for match in matches] == [[9, 18], [14, 18]]
+    assert ranked.json["results"]["water"]["matches"] == []
+
+    response = client.post(
+        "/ingredients/query", data={"descriptions[]": descriptions, "top_k": 0}
+    )
+    assert response.status_code == 400
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_ingredient_graph_refresh(stopwords, hierarchy, client):
+    from web.ingredients import load_product_graph
+
+    stopwords.return_value = []
+    products = [Product(id=f"herb_{n}", name=f"herb {n}") for n in range(10)]
+    hierarchy.return_value = products
+    previous = load_product_graph()
+
+    # Refreshes update the previous graph, rather than building a new graph
+    hierarchy.return_value = products + [Product(id="tofu", name="tofu")]
+    with patch("web.ingredients.ProductGraph") as graph_class:
+        graph = load_product_graph(previous)
+    graph_class.assert_not_called()
+    assert graph is not previous
+    assert graph.products_by_id["tofu"].name == "tofu"
+    assert previous.products_by_id.get("tofu") is None
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_graph_load_stages(stopwords, hierarchy, client):
+    from web.ingredients import load_product_graph
+
+    stopwords.return_value = []
+    records = [{"id": f"herb_{n}", "product": f"herb {n}"} for n in range(5)]
+    lines = [json.dumps({**r, "recipe_count": 1}).encode() for r in records]
+    hierarchy.return_value = HierarchyStream(SlowResponse(lines, delay=0.1))
+    Product.get_inflector()
+
+    # The graph is built as the hierarchy downloads; the time spent waiting for
+    # the download is reported as part of the fetch, rather than the build
+    stages = "hierarchy_fetch", "graph_build"
+    before = {stage: stage_seconds(stage) for stage in stages}
+    load_product_graph()
+    fetch, build = (stage_seconds(stage) - before[stage] for stage in stages)
+    assert fetch >= 0.5
+    assert build < 0.5
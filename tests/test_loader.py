@@ -0,0 +1,92 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import threading
+
+import pytest
+
+from web.loader import HierarchyNotModified, retrieve_hierarchy, retrieve_stopwords
+
+HIERARCHY = (
+    b'{"id": "onion", "product": "onion", "recipe_count": 10}\n'
+    b'{"id": "soy_milk", "product": "soy milk", "recipe_count": 5,'
+    b' "parent_id": "milk", "substitutes": ["oat_milk"]}\n'
+)
+
+
+class HierarchyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.endswith("/stalled"):
+            # Sends the first record, and then nothing more
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(HIERARCHY.splitlines(keepends=True)[0])
+            self.wfile.flush()
+            self.server.stalled.wait(5)
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(HIERARCHY)))
+        self.end_headers()
+        self.wfile.write(HIERARCHY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def hierarchy_url():
+    server = HTTPServer(("127.0.0.1", 0), HierarchyHandler)
+    server.stalled = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f"http://{host}:{port}/products/hierarchy"
+    server.stalled.set()
+    server.shutdown()
+
+
+def test_retrieve_hierarchy(hierarchy_url):
+    hierarchy = retrieve_hierarchy(url=hierarchy_url)
+    products = list(hierarchy)
+
+    assert [product.id for product in products] == ["onion", "soy_milk"]
+    assert products[1].name == "soy milk"
+    assert products[1].frequency == 5
+    assert products[1].parent_id == "milk"
+    assert products[1].substitutes == ("oat_milk",)
+    assert products[0].parent_id is None and products[0].substitutes == ()
+    assert hierarchy.validators == {"etag": '"v1"'}
+
+
+def test_retrieve_hierarchy_not_modified(hierarchy_url):
+    with pytest.raises(HierarchyNotModified):
+        retrieve_hierarchy(url=hierarchy_url, validators={"etag": '"v1"'})
+
+
+def test_retrieve_hierarchy_timeout(hierarchy_url):
+    hierarchy = iter(retrieve_hierarchy(url=f"{hierarchy_url}/stalled", timeout=0.2))
+
+    assert next(hierarchy).id == "onion"
+    with pytest.raises(TimeoutError):
+        next(hierarchy)
+
+
+def test_retrieve_stopwords(tmp_path):
+    path = tmp_path / "stopwords.txt"
+    path.write_text("# generated\nchopped\nsliced\n")
+
+    stopwords = retrieve_stopwords(str(path))
+    assert stopwords == ["chopped", "sliced"]
+    assert retrieve_stopwords(str(path)) is stopwords
+
+    # The file is re-read once it has been modified
+    path.write_text("chopped\n")
+    os.utime(path, ns=(0, 0))
+    assert retrieve_stopwords(str(path)) == ["chopped"]
+
+    with pytest.raises(RuntimeError):
+        retrieve_stopwords(str(tmp_path / "missing.txt"))
@@ -0,0 +1,36 @@
+from web.markup import render_markup, render_markup_batch
+from web.tokenizer import find_terms, tokenize
+
+
+def test_render_markup():
+    text = "salt & pepper <to taste>"
+    assert render_markup(text, []) == "salt &amp; pepper &lt;to taste&gt;"
+    assert render_markup(text, [(7, 13, {"class": "spice"})]) == (
+        'salt &amp; <mark class="spice">pepper</mark> &lt;to taste&gt;'
+    )
+
+    # Overlapping spans: the earliest (and then longest) span is rendered
+    spans = [(7, 13, None), (0, 4, None), (0, 13, None), (5, 8, None)]
+    assert render_markup(text, spans) == (
+        "<mark>salt &amp; pepper</mark> &lt;to taste&gt;"
+    )
+
+    # Adjacent spans are rendered separately, and empty spans are ignored
+    assert render_markup("ab", [(1, 2, None), (0, 1, None), (1, 1, None)]) == (
+        "<mark>a</mark><mark>b</mark>"
+    )
+
+
+def test_find_terms():
+    description = "Slow cooker, or a slow-cooker; slow oven"
+    tokens = tokenize(description)
+    terms = {("slow", "cooker"), ("slow",), ("oven",)}
+    spans = [(start, end) for _, start, end in find_terms(tokens, terms)]
+    assert [description[start:end] for start, end in spans] == [
+        "Slow cooker",
+        "slow",
+        "oven",
+    ]
+    assert render_markup_batch([(description, [(*spans[0], None)])]) == [
+        "<mark>Slow cooker</mark>, or a slow-cooker; slow oven"
+    ]
@@ -0,0 +1,39 @@
+import web.metrics
+from web.instrumentation import Histogram, REGISTRY
+
+
+def test_histogram_rendering():
+    histogram = Histogram("test_duration_seconds", "Test", buckets=(0.1, 1))
+    REGISTRY.remove(histogram)
+
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5, stage="a")
+
+    assert list(histogram.render()) == [
+        "# HELP test_duration_seconds Test",
+        "# TYPE test_duration_seconds histogram",
+        'test_duration_seconds_bucket{stage="a",le="0.1"} 1',
+        'test_duration_seconds_bucket{stage="a",le="1.0"} 2',
+        'test_duration_seconds_bucket{stage="a",le="+Inf"} 3',
+        'test_duration_seconds_sum{stage="a"} 5.55',
+        'test_duration_seconds_count{stage="a"} 3',
+    ]
+
+
+def test_metrics_endpoint(client, monkeypatch):
+    monkeypatch.setattr(web.metrics, "SERVER_TIMING", True)
+
+    response = client.post("/directions/query", data={"descriptions[]": ["oven"]})
+    assert "equipment_scan;dur=" in response.headers["Server-Timing"]
+
+    response = client.get("/metrics")
+    metrics = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/plain"
+    assert 'stage_duration_seconds_count{stage="equipment_scan"}' in metrics
+    assert 'knowledge_graph_request_lines_count{endpoint="directions"}' in metrics
+    assert 'knowledge_graph_stemmer_cache_hits_total{stemmer="equipment"}' in metrics
+    assert "knowledge_graph_graph_loaded 0.0" in metrics
+    assert "knowledge_graph_startup_import_seconds " in metrics
+    assert "knowledge_graph_startup_first_request_seconds " in metrics
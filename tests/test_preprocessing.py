@@ -0,0 +1,49 @@
+from collections import Counter
+import random
+
+from web.preprocessing import original_offset, strip_brackets, strip_brackets_batch
+
+
+def strip_brackets_legacy(description):
+    parens, unadorned_description = Counter(), ""
+    for char in description:
+        if char in {"(", "[", "{"}:
+            parens[char] += 1
+        if char in {")", "]", "}"}:
+            parens[char] -= 1
+        if not parens.total():
+            unadorned_description += char
+    return unadorned_description
+
+
+def generate_description(rng, depth=0):
+    pieces = []
+    for _ in range(rng.randint(0, 4)):
+        if depth < 3 and rng.random() < 0.3:
+            opener, closer = rng.choice(["()", "[]", "{}"])
+            pieces.append(opener + generate_description(rng, depth + 1) + closer)
+        else:
+            pieces.append(rng.choice(["tofu", " ", "soy milk", ", ", "é", "1/2"]))
+    return "".join(pieces)
+
+
+def test_well_formed_descriptions():
+    rng = random.Random(0)
+    descriptions = [generate_description(rng) for _ in range(2000)]
+
+    for description, (text, segments) in zip(
+        descriptions, strip_brackets_batch(descriptions)
+    ):
+        # The previous implementation retained the closing bracket of each group
+        expected = strip_brackets_legacy(description)
+        assert text == expected.translate(str.maketrans("", "", ")]}"))
+
+        for offset, char in enumerate(text):
+            assert description[original_offset(segments, offset)] == char
+
+
+def test_malformed_descriptions():
+    assert strip_brackets("tofu) (firm") == ("tofu) ", [(0, 0)])
+    assert strip_brackets("a (b ] c) d") == ("a  d", [(0, 0), (2, 9)])
+    assert strip_brackets("a (b [c) d") == ("a  d", [(0, 0), (2, 8)])
+    assert strip_brackets("(1 cup) milk")[0] == " milk"
@@ -0,0 +1,430 @@
+from threading import Event, Thread
+import time
+
+import pytest
+
+from web.models import product_graph
+from web.models.product import Product
+from web.models.product_graph import ProductGraph
+from web.models.product_relations import ProductRelations
+from web.models.product_store import ProductStore
+from web.models.snapshot import SnapshotError, read_snapshot
+from web.preprocessing import strip_brackets_batch
+
+
+def generate_hierarchy():
+    return [
+        Product(id="onion", name="onion", frequency=10),
+        Product(id="red_onion", name="red onions", frequency=3),
+        Product(id="red_onion", name="red onion", frequency=2),
+        Product(id="soy_milk", name="soy milk", frequency=5),
+    ]
+
+
+def test_snapshot_roundtrip(tmp_path):
+    path = tmp_path / "graph.snapshot"
+    graph = ProductGraph(generate_hierarchy(), stopwords=["chopped"])
+    graph.save_snapshot(path)
+
+    restored = ProductGraph.from_snapshot(path, version=graph.version)
+
+    assert restored.version == graph.version
+    assert restored.stopwords == graph.stopwords
+    assert restored.products_by_id.to_sections() == graph.products_by_id.to_sections()
+    assert restored.name_terms == graph.name_terms
+    assert restored.product_index.index == graph.product_index.index
+    assert restored.stopword_index.index == graph.stopword_index.index
+    assert {k: v.to_dict() for k, v in restored.products_by_id.items()} == {
+        k: v.to_dict() for k, v in graph.products_by_id.items()
+    }
+    assert restored.products_by_id["red_onion"].name == "red onion"
+
+
+def test_snapshot_version_mismatch(tmp_path):
+    path = tmp_path / "graph.snapshot"
+    graph = ProductGraph(generate_hierarchy())
+    graph.save_snapshot(path)
+
+    hierarchy = generate_hierarchy()[:-1]
+    version = ProductGraph.hierarchy_version(hierarchy, [])
+    with pytest.raises(SnapshotError):
+        ProductGraph.from_snapshot(path, version=version)
+
+
+def test_hierarchy_version():
+    graph = ProductGraph(generate_hierarchy())
+
+    assert graph.version == ProductGraph.hierarchy_version(generate_hierarchy(), [])
+
+
+def test_product_store_merge():
+    store = ProductStore()
+    for product in generate_hierarchy():
+        store.add(product)
+
+    assert len(store) == 3
+    assert list(store) == ["onion", "red_onion", "soy_milk"]
+    assert store["red_onion"].to_dict() == {
+        "id": "red_onion",
+        "product": "red onion",
+        "recipe_count": 5,
+    }
+    assert list(store.record_ordinals) == [0, 1, 1, 2]
+    assert store.get("tofu") is None
+
+
+def test_product_metadata():
+    graph = ProductGraph(generate_hierarchy())
+    product = graph.products_by_id["red_onion"]
+
+    plural = product.get_metadata("2 red onions", graph)
+    singular = product.get_metadata("1 red onion", graph)
+
+    assert graph.products_by_id.singulars[product.ordinal] == "red onion"
+    assert graph.products_by_id.plurals[product.ordinal] == "red onions"
+    assert plural["is_plural"] is True
+    assert plural["product"] == "red onions"
+    assert singular["is_plural"] is False
+    assert singular["product"] == "red onion"
+
+
+def test_parallel_build(tmp_path, monkeypatch):
+    monkeypatch.setattr(ProductGraph, "BUILD_CHUNK_SIZE", 2)
+    stopwords = ["chopped", "red", "milk", "organic"]
+
+    serial = ProductGraph(generate_hierarchy(), stopwords=stopwords)
+    parallel = ProductGraph(generate_hierarchy(), stopwords=stopwords, processes=2)
+
+    serial.save_snapshot(tmp_path / "serial.snapshot")
+    parallel.save_snapshot(tmp_path / "parallel.snapshot")
+
+    _, serial_sections = read_snapshot(tmp_path / "serial.snapshot")
+    _, parallel_sections = read_snapshot(tmp_path / "parallel.snapshot")
+    assert parallel_sections == serial_sections
+    serial_terms = serial.product_index.index._terms
+    parallel_terms = parallel.product_index.index._terms
+    assert list(parallel_terms.items()) == list(serial_terms.items())
+
+
+def test_parallel_build_while_stemming(monkeypatch):
+    # Worker processes must not inherit locks held by other threads; here, the
+    # stemmer lock is held by another thread when the workers start
+    monkeypatch.setattr(ProductGraph, "BUILD_CHUNK_SIZE", 2)
+    build_product_index = ProductGraph.build_product_index
+
+    def build_while_stemming(graph, *args):
+        locked = Event()
+
+        def stem():
+            with Product.stemmer.lock:
+                locked.set()
+                time.sleep(1)
+
+        Thread(target=stem).start()
+        locked.wait()
+        build_product_index(graph, *args)
+
+    monkeypatch.setattr(ProductGraph, "build_product_index", build_while_stemming)
+    built = []
+    build = Thread(
+        target=lambda: built.append(ProductGraph(generate_hierarchy(), processes=2)),
+        daemon=True,
+    )
+    build.start()
+    build.join(timeout=30)
+    assert built
+
+
+def test_exact_matches():
+    hierarchy = generate_hierarchy() + [
+        Product(id="chopped_tomato", name="chopped tomatoes"),
+        Product(id="tomato", name="tomato", frequency=20),
+        Product(id="soya_milk", name="Soy Milk"),
+    ]
+    graph = ProductGraph(hierarchy, stopwords=["chopped"])
+    descriptions = [
+        "onions",
+        "Red Onion",
+        "soy milk",
+        "chopped tomatoes",
+        "tomato (chopped)",
+        "2 tomatoes",
+        "water",
+    ]
+    unadorned = ["onions", "Red Onion", "soy milk", "chopped tomatoes", "tomato "]
+    unadorned += ["2 tomatoes", "water"]
+
+    def match():
+        results = graph.match_descriptions(descriptions, unadorned)
+        return {k: (p.id, terms, span) for k, (p, terms, span) in results.items()}
+
+    exact = match()
+    assert graph.exact_match_stats()["hits"] == 3
+
+    # Names shared by several products are not exact-match keys; results are
+    # identical to those of a full search
+    assert ("soy", "milk") not in graph.exact_terms
+    graph.exact_terms = {}
+    assert match() == exact
+    assert exact[0] == ("onion", [("onion",)], (0, 6))
+    assert exact[5] == ("tomato", [("tomato",)], (2, 10))
+    assert graph.exact_match_stats()["lookups"] == 2 * len(descriptions)
+
+
+def test_candidate_ranking(monkeypatch):
+    hierarchy = generate_hierarchy() + [
+        Product(id="soya_milk", name="Soy Milk", frequency=1),
+        Product(id="soy_drink", name="soy milk", frequency=5),
+        Product(id="milk", name="milk", frequency=8),
+    ]
+    graph = ProductGraph(hierarchy)
+    descriptions = ["soy milk, warmed", "Soy  Milk warmed!", "red onion and milk"]
+    stripped = strip_brackets_batch(descriptions)
+
+    def rank():
+        rankings = graph.rank_descriptions(descriptions, stripped, top_k=5)
+        return {k: [m["product"].id for m in v] for k, v in rankings.items()}
+
+    # Products sharing a name are ranked by frequency, and then in index order;
+    # descriptions that differ only in punctuation and spacing share a search,
+    # but each has its own span
+    results = graph.match_descriptions(descriptions, descriptions)
+    assert {k: (p.id, span) for k, (p, _, span) in results.items()} == {
+        0: ("soy_milk", (0, 8)),
+        1: ("soy_milk", (0, 9)),
+        2: ("red_onion", (0, 9)),
+    }
+    assert rank()[0] == ["soy_milk", "soy_drink", "soya_milk", "milk"]
+    assert rank()[2] == ["red_onion", "onion", "milk"]
+
+    # Candidates with the longest name terms are considered first
+    monkeypatch.setattr(ProductGraph, "MAX_LINE_CANDIDATES", 2)
+    assert rank() == {
+        0: ["soy_milk", "soya_milk"],
+        1: ["soy_milk", "soya_milk"],
+        2: ["red_onion", "onion"],
+    }
+
+
+def describe_graph(graph):
+    # Graph contents, addressed by product id rather than by ordinal
+    store = graph.products_by_id
+    index = graph.product_index.index
+    return {
+        "version": graph.version,
+        "products": {
+            product_id: (
+                product.name,
+                product.frequency,
+                product.inflections(),
+                graph.name_terms[product.ordinal],
+                index._documents.get(product.ordinal),
+            )
+            for product_id, product in store.items()
+        },
+        "postings": {
+            term: [(store.ids[ordinal], count) for ordinal, count in postings.items()]
+            for term, postings in index._terms.items()
+        },
+        "records": [
+            (store.ids[ordinal], name, frequency)
+            for ordinal, name, frequency in zip(
+                store.record_ordinals, store.record_names, store.record_frequencies
+            )
+        ],
+        "stopwords": graph.stopwords,
+        "exact_terms": {
+            term: store.ids[ordinal] for term, ordinal in graph.exact_terms.items()
+        },
+        "name_index": {
+            term: [store.ids[ordinal] for ordinal in ordinals]
+            for term, ordinals in graph.name_index.items()
+        },
+    }
+
+
+def test_incremental_update(tmp_path):
+    stopwords = ["chopped", "tomatoes"]
+    herbs = [Product(id=f"herb_{n}", name=f"herb {n}") for n in range(40)]
+    hierarchy = generate_hierarchy() + [
+        Product(id="tomato", name="tomato", frequency=8),
+        Product(id="garlic", name="garlic clove", frequency=4),
+        Product(id="leek", name="leeks", frequency=1),
+    ]
+    updated = [
+        Product(id="onion", name="onion", frequency=12),
+        Product(id="red_onion", name="red onions", frequency=3),
+        Product(id="soy_milk", name="soy milk", frequency=5),
+        Product(id="soy_milk", name="soya milk", frequency=1),
+        Product(id="garlic", name="garlic clove", frequency=4),
+        Product(id="garlic", name="garlic", frequency=2),
+        Product(id="leek", name="leek", frequency=1),
+        Product(id="chive", name="chives", frequency=2),
+    ]
+    hierarchy, updated = hierarchy + herbs, updated + herbs
+
+    graph = ProductGraph(hierarchy, stopwords=stopwords)
+    result = graph.update(updated, stopwords=stopwords)
+    expected = ProductGraph(updated, stopwords=stopwords)
+
+    # Re-weighted, merged, renamed, added and removed products are reflected, and
+    # removing the tomato product re-validates the "tomatoes" stopword
+    assert None in result.products_by_id.ids
+    assert describe_graph(result) == describe_graph(expected)
+    assert "tomatoes" in result.stopwords
+    assert "tomatoes" not in graph.stopwords
+    assert describe_graph(graph) == describe_graph(
+        ProductGraph(hierarchy, stopwords=stopwords)
+    )
+
+    def matches(graph):
+        descriptions = ["2 red onions", "soya milk", "3 leeks", "chives", "garlic"]
+        descriptions += ["soy milk"]
+        results = graph.match_descriptions(descriptions, descriptions)
+        return {k: (p.id, terms) for k, (p, terms, _) in results.items()}
+
+    assert matches(result) == matches(expected)
+
+    # Ties between equally-weighted candidates are resolved by hierarchy order,
+    # rather than by the order in which products were added to the graph
+    soy_drink = Product(id="soy_drink", name="soy milk", frequency=5)
+    tied = graph.update([soy_drink] + hierarchy, stopwords=stopwords)
+    expected_tied = ProductGraph([soy_drink] + hierarchy, stopwords=stopwords)
+    assert describe_graph(tied) == describe_graph(expected_tied)
+    assert matches(tied) == matches(expected_tied)
+    assert matches(tied)[5] == ("soy_drink", [("soy", "milk")])
+
+    # Updated graphs may be saved and restored
+    path = tmp_path / "graph.snapshot"
+    result.save_snapshot(path)
+    restored = ProductGraph.from_snapshot(path, version=result.version)
+    assert describe_graph(restored) == describe_graph(expected)
+
+    # Large changes, and changes to the stopwords, cause a rebuild
+    rebuilt = graph.update(updated[:3], stopwords=stopwords)
+    assert len(rebuilt.products_by_id.ids) == len(rebuilt.products_by_id)
+    rebuilt = graph.update(hierarchy, stopwords=["chopped"])
+    assert describe_graph(rebuilt) == describe_graph(
+        ProductGraph(hierarchy, stopwords=["chopped"])
+    )
+
+
+def test_clearwords_read_once(monkeypatch):
+    graph = ProductGraph(generate_hierarchy(), stopwords=["chopped"])
+
+    def read(*args, **kwargs):
+        raise AssertionError("clear-words re-read")
+
+    # Refreshes re-use the clear-words read for the first build
+    monkeypatch.setattr(product_graph, "open", read, raising=False)
+    hierarchy = generate_hierarchy() + [Product(id="tofu", name="tofu")]
+    updated = graph.update(hierarchy, stopwords=["chopped"])
+    assert updated.stopwords == graph.stopwords
+
+
+def test_product_relations(tmp_path):
+    hierarchy = [
+        Product(id="onion", name="onion", parent_id="vegetable"),
+        Product(id="vegetable", name="vegetable"),
+        Product(id="red_onion", name="red onion", parent_id="onion"),
+        Product(id="leek", name="leek", parent_id="vegetable", substitutes=["onion"]),
+        Product(id="shallot", name="shallot", parent_id="onion"),
+        Product(id="shallot", name="shallots", parent_id="leek"),
+        Product(id="tofu", name="tofu", parent_id="unknown", substitutes=["tofu"]),
+        Product(id="soy_milk", name="soy milk", parent_id="soy_cream"),
+        Product(id="soy_cream", name="soy cream", parent_id="soy_milk"),
+    ]
+    graph = ProductGraph(hierarchy)
+    store = graph.products_by_id
+
+    def ids(ordinals):
+        return [store.ids[ordinal] for ordinal in ordinals]
+
+    def is_a(product_id, ancestor_id):
+        return graph.relations.is_a(
+            store.ordinal(product_id), store.ordinal(ancestor_id)
+        )
+
+    def related(relations, query):
+        return {
+            product_id: ids(query(relations, store.ordinal(product_id)))
+            for product_id in store
+        }
+
+    relations = graph.relations
+    assert ids(relations.ancestors(store.ordinal("shallot"))) == ["onion", "vegetable"]
+    assert ids(relations.descendants(store.ordinal("vegetable"))) == [
+        "onion",
+        "red_onion",
+        "shallot",
+        "leek",
+    ]
+    assert ids(relations.child_ordinals(store.ordinal("onion"))) == [
+        "red_onion",
+        "shallot",
+    ]
+    assert ids(relations.substitute_ordinals(store.ordinal("leek"))) == ["onion"]
+    assert is_a("red_onion", "vegetable") and is_a("onion", "onion")
+    assert not is_a("vegetable", "onion") and not is_a("leek", "onion")
+
+    # Unknown and self-referential relations are ignored, and cycles are broken
+    assert relations.parent(store.ordinal("tofu")) is None
+    assert relations.substitute_ordinals(store.ordinal("tofu")) == []
+    assert is_a("soy_milk", "soy_cream") != is_a("soy_cream", "soy_milk")
+
+    # Relations are restored from snapshots, and rebuilt by updates
+    path = tmp_path / "graph.snapshot"
+    graph.save_snapshot(path)
+    restored = ProductGraph.from_snapshot(path, version=graph.version)
+    for query in ProductRelations.ancestors, ProductRelations.descendants:
+        assert related(restored.relations, query) == related(relations, query)
+
+    hierarchy[0] = Product(id="onion", name="onion", parent_id="leek")
+    updated = graph.update(hierarchy)
+    assert updated.version == ProductGraph.hierarchy_version(hierarchy, [])
+    assert updated.products_by_id is not store
+    store = updated.products_by_id
+    assert ids(updated.relations.ancestors(store.ordinal("red_onion"))) == [
+        "onion",
+        "leek",
+        "vegetable",
+    ]
+    assert ids(relations.ancestors(store.ordinal("red_onion"))) == [
+        "onion",
+        "vegetable",
+    ]
+
+    # Children are ordered as in the hierarchy, as they would be once rebuilt
+    def relatives(graph, query, product_id):
+        store = graph.products_by_id
+        return [store.ids[o] for o in query(graph.relations, store.ordinal(product_id))]
+
+    hierarchy.insert(
+        1, Product(id="white_onion", name="white onion", parent_id="onion")
+    )
+    updated, rebuilt = updated.update(hierarchy), ProductGraph(hierarchy)
+    assert relatives(updated, ProductRelations.child_ordinals, "onion") == [
+        "white_onion",
+        "red_onion",
+        "shallot",
+    ]
+    for query in ProductRelations.child_ordinals, ProductRelations.descendants:
+        for product_id in "onion", "leek", "vegetable":
+            assert relatives(updated, query, product_id) == relatives(
+                rebuilt, query, product_id
+            )
+
+    # Cycles are broken by removing the same relations, too
+    soy_milk = [product.id for product in hierarchy].index("soy_milk")
+    hierarchy[soy_milk] = Product(
+        id="soy_milk", name="soy milk", parent_id="soy_yogurt"
+    )
+    hierarchy.insert(
+        0, Product(id="soy_yogurt", name="soy yogurt", parent_id="soy_milk")
+    )
+    updated, rebuilt = updated.update(hierarchy), ProductGraph(hierarchy)
+    for query in ProductRelations.ancestors, ProductRelations.descendants:
+        for product_id in "soy_milk", "soy_cream", "soy_yogurt":
+            assert relatives(updated, query, product_id) == relatives(
+                rebuilt, query, product_id
+            )
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from web.models.product import Product
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_product_lookup(stopwords, hierarchy, client):
+    stopwords.return_value = []
+    hierarchy.return_value = [
+        Product(id="onion", name="onion", frequency=10),
+        Product(id="soy_milk", name="soy milk", frequency=5),
+    ]
+
+    # The graph is loaded on demand by product lookups
+    response = client.get("/products/onion")
+    assert response.json["product"] == "onion"
+    assert response.headers["Cache-Control"] == "public, max-age=300"
+
+    etag = response.headers["ETag"]
+    response = client.get("/products/onion", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get("/products/tofu").status_code == 404
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_product_batch_lookup(stopwords, hierarchy, client):
+    stopwords.return_value = []
+    hierarchy.return_value = [
+        Product(id="onion", name="onion", frequency=10),
+        Product(id="soy_milk", name="soy milk", frequency=5),
+    ]
+    query = {"ids[]": ["soy_milk", "tofu", "onion"]}
+
+    response = client.get("/products", query_string=query)
+    results = response.json["results"]
+    assert sorted(results) == ["onion", "soy_milk", "tofu"]
+    assert results["soy_milk"] == client.get("/products/soy_milk").json
+    assert results["tofu"] is None
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/products", query_string=query, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    response = client.post("/products", data=query)
+    assert response.json["results"] == results
+    assert "ETag" not in response.headers
+
+    response = client.get("/products", query_string={"ids[]": ["onion"] * 501})
+    assert response.status_code == 400
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+def test_product_graph_unavailable(hierarchy, client):
+    hierarchy.side_effect = OSError("Connection refused")
+    assert client.get("/products/onion").status_code == 503
+    query = {"descriptions[]": ["onion"]}
+    assert client.post("/ingredients/query", data=query).status_code == 503
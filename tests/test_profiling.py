@@ -0,0 +1,60 @@
+import pstats
+
+import pytest
+
+import web.profiling
+from web.app import app
+from web.profiling import ProfilingMiddleware, profile_graph_loads
+
+
+@pytest.fixture
+def profiling(monkeypatch, tmp_path):
+    monkeypatch.setattr(web.profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(web.profiling, "PROFILE_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(web.profiling, "PROFILE_RETENTION", 2)
+    monkeypatch.setattr(app, "wsgi_app", ProfilingMiddleware(app.wsgi_app))
+    return tmp_path
+
+
+def test_query_profiling(profiling, client, monkeypatch):
+    headers = {"X-Profile-Token": "secret"}
+    query = {"descriptions[]": ["place the profiled casserole dish in the oven"]}
+
+    response = client.post("/directions/query", data=query, headers=headers)
+    name = response.headers["X-Profile"]
+    unprofiled = client.post("/directions/query", data=query)
+    assert "X-Profile" not in unprofiled.headers
+    assert response.json == unprofiled.json
+
+    profiles = client.get("/profiles", headers=headers).json["profiles"]
+    assert [profile["name"] for profile in profiles] == [name]
+    stats = pstats.Stats(str(profiling / name))
+    assert any(function == "match_directions" for _, _, function in stats.stats)
+
+    response = client.get(f"/profiles/{name}?format=text", headers=headers)
+    assert "match_directions" in response.text
+    response = client.get(f"/profiles/{name}", headers=headers)
+    assert response.data == (profiling / name).read_bytes()
+    response.close()
+
+    # Only the most recent profiles are retained
+    for _ in range(2):
+        client.post("/directions/query", data=query, headers=headers)
+    profiles = client.get("/profiles", headers=headers).json["profiles"]
+    assert len(profiles) == 2 and name not in {p["name"] for p in profiles}
+
+    # Profiles are only available to requests bearing the token
+    assert client.get("/profiles").status_code == 403
+    assert client.get("/profiles/missing.prof", headers=headers).status_code == 404
+    monkeypatch.setattr(web.profiling, "PROFILE_TOKEN", None)
+    assert client.get("/profiles", headers=headers).status_code == 404
+
+
+def test_graph_load_profiling(profiling, monkeypatch):
+    monkeypatch.setattr(web.profiling, "PROFILE_GRAPH_LOADS", "startup")
+    load = profile_graph_loads(lambda previous: previous or "graph")
+
+    assert load(None) == "graph"
+    assert load("previous") == "previous"
+    profiles = web.profiling.list_profiles()
+    assert [entry.name.split("-")[1:3] for entry in profiles] == [["graph", "load"]]
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from web.models.product import Product
+
+
+@patch("web.ingredients.retrieve_hierarchy")
+@patch("web.ingredients.retrieve_stopwords")
+def test_relation_queries(stopwords, hierarchy, client):
+    stopwords.return_value = []
+    hierarchy.return_value = [
+        Product(id="vegetable", name="vegetable"),
+        Product(id="onion", name="onion", parent_id="vegetable"),
+        Product(id="red_onion", name="red onion", parent_id="onion"),
+        Product(id="leek", name="leek", parent_id="vegetable", substitutes=["onion"]),
+    ]
+    query = {"ids[]": ["red_onion", "vegetable", "tofu"]}
+
+    response = client.get("/relations/ancestors", query_string=query)
+    assert response.json["results"] == {
+        "red_onion": ["onion", "vegetable"],
+        "vegetable": [],
+        "tofu": None,
+    }
+    assert "ETag" in response.headers
+
+    response = client.post("/relations/descendants", data=query)
+    results = response.json["results"]
+    assert results["vegetable"] == ["onion", "red_onion", "leek"]
+    assert results["red_onion"] == []
+
+    response = client.get("/relations/children", query_string={"ids[]": "vegetable"})
+    assert response.json["results"] == {"vegetable": ["onion", "leek"]}
+
+    response = client.get("/relations/substitutes", query_string={"ids[]": "leek"})
+    assert response.json["results"] == {"leek": ["onion"]}
+
+    query["ancestor_ids[]"] = ["onion", "vegetable", "meat"]
+    response = client.get("/relations/is-a", query_string=query)
+    assert response.json["results"] == {
+        "red_onion": {"onion": True, "vegetable": True, "meat": None},
+        "vegetable": {"onion": False, "vegetable": True, "meat": None},
+        "tofu": None,
+    }
+
+    query = {"ids[]": ["onion"], "ancestor_ids[]": ["vegetable"] * 501}
+    assert client.get("/relations/is-a", query_string=query).status_code == 400
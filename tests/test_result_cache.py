@@ -0,0 +1,94 @@
+from web.directions import direction_cache
+from web.result_cache import ResultCache
+
+
+class Computation:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, descriptions):
+        self.batches.append(descriptions)
+        return {
+            description: {"length": len(description)} for description in descriptions
+        }
+
+
+def test_fetch_computes_misses_once():
+    cache = ResultCache("test", path=None)
+    compute = Computation()
+
+    cache.fetch("v1", ["a", "bb", "a"], compute)
+    results = cache.fetch("v1", ["bb", "ccc"], compute)
+
+    assert results == {"bb": {"length": 2}, "ccc": {"length": 3}}
+    assert compute.batches == [["a", "bb"], ["ccc"]]
+    assert cache.statistics()["hits"] == 1
+    assert cache.statistics()["misses"] == 3
+
+
+def test_fetch_in_chunks():
+    cache = ResultCache("test", path=None)
+    compute = Computation()
+
+    results = cache.fetch("v1", ["a", "b", "a", "c", "d", "b", "e"], compute, 2)
+
+    assert list(results) == ["a", "b", "c", "d", "e"]
+    assert compute.batches == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_version_invalidation():
+    cache = ResultCache("test", path=None)
+    compute = Computation()
+
+    cache.fetch("v1", ["a"], compute)
+    cache.fetch("v2", ["a"], compute)
+
+    assert compute.batches == [["a"], ["a"]]
+
+
+def test_bounded_eviction():
+    cache = ResultCache("test", max_entries=2, path=None)
+    compute = Computation()
+
+    cache.fetch("v1", ["a", "b", "c"], compute)
+
+    assert [description for _, description in cache.entries] == ["b", "c"]
+
+    cache = ResultCache("test", path=None)
+    cache.fetch("v1", ["a"], compute)
+    size = cache.statistics()["bytes"]
+
+    cache = ResultCache("test", max_bytes=size * 2, path=None)
+    cache.fetch("v1", ["a", "b", "c"], compute)
+
+    assert cache.statistics()["bytes"] <= size * 2
+    assert len(cache.entries) == 2
+
+
+def test_shared_cache(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    compute = Computation()
+
+    ResultCache("test", path=path).fetch("v1", ["a", "b"], compute)
+    other = ResultCache("test", path=path)
+    results = other.fetch("v1", ["a", "b", "c"], compute)
+
+    assert results["a"] == {"length": 1}
+    assert compute.batches == [["a", "b"], ["c"]]
+    assert other.statistics()["shared_hits"] == 2
+
+
+def test_cached_responses(client):
+    direction_cache.entries.clear()
+    descriptions = [
+        "place casserole dish in oven",
+        "stir",
+        "place casserole dish in oven",
+    ]
+
+    uncached = client.post("/directions/query", data={"descriptions[]": descriptions})
+    hits = direction_cache.statistics()["hits"]
+    cached = client.post("/directions/query", data={"descriptions[]": descriptions})
+
+    assert direction_cache.statistics()["hits"] == hits + 2
+    assert cached.data == uncached.data
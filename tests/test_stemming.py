@@ -0,0 +1,51 @@
+from web.directions import stemmer as equipment_stemmer
+from web.models.product import Product
+from web.stemming import StemmingService
+
+
+class UppercaseStemmer(StemmingService):
+    def stem_word(self, term):
+        return term.upper()
+
+
+def test_bounded_cache():
+    stemmer = UppercaseStemmer(maxsize=2)
+
+    assert stemmer.stem_many(["a", "b", "a", "c"]) == ["A", "B", "A", "C"]
+    assert list(stemmer.cache) == ["a", "c"]
+
+    stats = stemmer.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["cache_entries"] == 2
+
+
+def test_cache_eviction_order():
+    stemmer = UppercaseStemmer(maxsize=2)
+
+    # Recently-used words are retained; words that stem to an empty string are
+    # cached like any other
+    stemmer.stem_many(["a", "b", "a", "c", "a", "d"])
+    assert list(stemmer.cache) == ["a", "d"]
+    stemmer.stem_word = lambda term: ""
+    assert stemmer.stem_many(["'", "'"]) == ["", ""]
+    assert stemmer.stats()["misses"] == 5
+
+
+def test_vocabulary():
+    stemmer = UppercaseStemmer(maxsize=0)
+    stemmer.use_vocabulary(stemmer.build_vocabulary(["a", "b"]))
+
+    assert stemmer.stem("a") == "A"
+    assert stemmer.stats()["hits"] == 1
+
+
+def test_product_stemming():
+    stemmer = Product.ProductStemmer()
+
+    assert stemmer.stem_many(["mayonnaise", "jalapeño"]) == ["mayonnai", "jalapeno"]
+
+    # Instances share the snowball stemmer, and so the lock that serializes it
+    assert stemmer.lock is Product.stemmer.lock
+    assert stemmer.stemmer_en is Product.stemmer.stemmer_en
+    assert equipment_stemmer.lock is not stemmer.lock
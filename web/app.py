@@ -1,8 +1,20 @@
-from flask import Flask
+import time
+
+# Cold-start costs -- the time taken to import the application, and until the
+# first request is served -- are reported by the metrics module
+started = time.perf_counter()
+
+from flask import Flask  # noqa
 
 app = Flask(__name__)
+app.startup = {"import_seconds": None, "first_request_seconds": None}
 
 
 import web.directions  # noqa
 import web.ingredients  # noqa
+import web.metrics  # noqa
 import web.products  # noqa
+import web.profiles  # noqa
+import web.relations  # noqa
+
+app.startup["import_seconds"] = time.perf_counter() - started
@@ -0,0 +1,276 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BufferedReader, BytesIO, RawIOBase
+import os
+import sys
+from urllib.parse import parse_qs
+
+from web.app import app as flask_app
+from web.directions import fetch_directions, render_directions
+from web.ingredients import fetch_ingredients, render_ingredients
+from web.instrumentation import request_lines
+
+# An ASGI entry point that serves the same routes as the Flask application: for
+# example, `uvicorn web.asgi:app`.  Form-encoded ingredient and direction
+# queries that arrive within a short window of each other are matched together
+# in a single batch on a bounded thread pool; all other requests are passed to
+# the Flask application on the same pool, which reads their bodies -- such as
+# streamed bulk queries -- as they arrive.
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 4))
+ASGI_BATCH_WINDOW = float(os.environ.get("ASGI_BATCH_WINDOW", 0.005))
+ASGI_BATCH_LINES = int(os.environ.get("ASGI_BATCH_LINES", 1000))
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", 256))
+ASGI_RETRY_AFTER = int(os.environ.get("ASGI_RETRY_AFTER", 1))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+
+
+class MicroBatcher:
+    def __init__(self, process, window=ASGI_BATCH_WINDOW, max_lines=ASGI_BATCH_LINES):
+        self.process = process
+        self.window = window
+        self.max_lines = max_lines
+        self.pending = []
+        self.pending_lines = 0
+        self.timer = None
+
+    async def submit(self, descriptions):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((descriptions, future))
+        self.pending_lines += len(descriptions)
+        if self.pending_lines >= self.max_lines:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_lines = self.pending, [], 0
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(
+            executor, self.process, [descriptions for descriptions, _ in batch]
+        )
+
+        def resolve(task):
+            for index, (_, future) in enumerate(batch):
+                if future.cancelled():
+                    continue
+                if task.exception():
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result()[index])
+
+        task.add_done_callback(resolve)
+
+
+def process_ingredients(batch):
+    flask_app.graph_manager.ensure_loaded()
+    graph = flask_app.graph_manager.graph
+    results = fetch_ingredients(
+        graph, [d for descriptions in batch for d in descriptions]
+    )
+    return [render_ingredients(descriptions, results) for descriptions in batch]
+
+
+def process_directions(batch):
+    results = fetch_directions([d for descriptions in batch for d in descriptions])
+    return [render_directions(descriptions, results) for descriptions in batch]
+
+
+batchers = {
+    "/ingredients/query": (MicroBatcher(process_ingredients), "ingredients"),
+    "/directions/query": (MicroBatcher(process_directions), "directions"),
+}
+pending_requests = 0
+
+
+class RequestBody(RawIOBase):
+    # The body of a request, as a file for a WSGI application to read on the
+    # thread pool; each read waits for the event loop to receive more of it
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = memoryview(b"")
+        self.more_body = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and self.more_body:
+            message = asyncio.run_coroutine_threadsafe(
+                self.receive(), self.loop
+            ).result()
+            if message["type"] == "http.disconnect":
+                break
+            self.pending = memoryview(message.get("body", b""))
+            self.more_body = message.get("more_body", False)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def send_response(send, status, headers, body):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_flask_response(send, response):
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in response.headers.items()
+    ]
+    await send_response(send, response.status_code, headers, response.get_data())
+
+
+def request_headers(scope):
+    return {
+        name.decode("latin-1").lower(): value.decode("latin-1")
+        for name, value in scope["headers"]
+    }
+
+
+def wsgi_environ(scope, body):
+    headers = request_headers(scope)
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_TYPE": headers.pop("content-type", ""),
+        "CONTENT_LENGTH": headers.pop("content-length", ""),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers.items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+async def call_flask(scope, body, send):
+    # Runs the WSGI application on the thread pool, forwarding each chunk of its
+    # (possibly streamed) response to the client as it is produced
+    loop = asyncio.get_running_loop()
+
+    def forward(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        iterable = flask_app(wsgi_environ(scope, body), start_response)
+        try:
+            forward(
+                {
+                    "type": "http.response.start",
+                    "status": started["status"],
+                    "headers": started["headers"],
+                }
+            )
+            for chunk in iterable:
+                if chunk:
+                    forward(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            forward({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    await loop.run_in_executor(executor, run)
+
+
+async def handle_query(scope, body, send, batcher, endpoint):
+    global pending_requests
+
+    # Shed load once too many queries are waiting, rather than queueing them
+    if pending_requests >= ASGI_MAX_PENDING:
+        headers = [(b"retry-after", str(ASGI_RETRY_AFTER).encode())]
+        await send_response(send, 429, headers, b"")
+        return
+
+    form = parse_qs(body.decode(errors="replace"), keep_blank_values=True)
+    if "top_k" in form or "x-profile-token" in request_headers(scope):
+        # Ranked alternatives, and queries to be profiled, are not batched
+        return await call_flask(scope, BytesIO(body), send)
+    descriptions = form.get("descriptions[]", [])
+    request_lines.observe(len(descriptions), endpoint=endpoint)
+
+    pending_requests += 1
+    try:
+        result = await batcher.submit(descriptions)
+    except RuntimeError as e:
+        await send_response(send, 503, [], str(e).encode())
+        return
+    finally:
+        pending_requests -= 1
+    await send_flask_response(send, flask_app.json.response(result))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            flask_app.graph_manager.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    content_type = request_headers(scope).get("content-type", "")
+    batcher = batchers.get(scope["path"])
+    if (
+        batcher
+        and scope["method"] == "POST"
+        and content_type.startswith("application/x-www-form-urlencoded")
+    ):
+        body = await read_body(receive)
+        return await handle_query(scope, body, send, *batcher)
+    body = BufferedReader(RequestBody(receive, asyncio.get_running_loop()))
+    return await call_flask(scope, body, send)
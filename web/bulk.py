@@ -0,0 +1,77 @@
+from itertools import islice
+import json
+import os
+
+from flask import Response, abort, request, stream_with_context
+
+from web.app import app
+
+
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 100))
+
+
+class InvalidRecipe:
+    # Stands in for a recipe line that could not be parsed, in a streamed request
+    def __init__(self, line, error):
+        self.line = line
+        self.error = error
+
+    def result(self):
+        return {"line": self.line, "error": self.error}
+
+
+def _parse_descriptions(recipe):
+    descriptions = recipe.get("descriptions") if isinstance(recipe, dict) else recipe
+    if not isinstance(descriptions, list):
+        raise ValueError("Expected a list of descriptions")
+    return [str(description) for description in descriptions]
+
+
+def _parse_lines(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield _parse_descriptions(json.loads(line))
+        except ValueError as e:
+            yield InvalidRecipe(number, str(e))
+
+
+def read_recipes():
+    # Newline-delimited JSON request bodies are parsed incrementally, one recipe
+    # per line, as the body is received; the response has already begun by the
+    # time that a line is parsed, so invalid lines produce an error result line
+    # in place of their results.  JSON bodies contain an array of recipes, and
+    # are validated before responding
+    if request.mimetype == "application/x-ndjson":
+        return _parse_lines(request.stream)
+
+    recipes = request.get_json()
+    if not isinstance(recipes, list):
+        abort(400)
+    try:
+        return [_parse_descriptions(recipe) for recipe in recipes]
+    except ValueError as e:
+        abort(400, str(e))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def stream_results(recipes, process):
+    # Each result line is serialized exactly as jsonify would serialize it
+    def generate():
+        for chunk in _chunks(recipes, BULK_CHUNK_SIZE):
+            valid = [r for r in chunk if not isinstance(r, InvalidRecipe)]
+            results = iter(process(valid))
+            for recipe in chunk:
+                if isinstance(recipe, InvalidRecipe):
+                    result = recipe.result()
+                else:
+                    result = next(results)
+                yield app.json.dumps(result, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
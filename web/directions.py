@@ -1,77 +1,87 @@
 from collections import defaultdict
-from functools import lru_cache
+from functools import cache
+import hashlib
+import json
+from threading import Lock
+
 from flask import jsonify, request
-from hashedixsearch import HashedIXSearch
 from snowballstemmer import stemmer
+
 # import spacy
 # from spacy.symbols import VERB
 from stop_words import get_stop_words as get_stopwords
 
 from web.app import app
+from web.bulk import read_recipes, stream_results
+from web.instrumentation import request_lines, timed
 from web.loader import (
     CACHE_PATHS,
     load_queries,
 )
+from web.markup import render_markup_batch
+from web.models.equipment import EquipmentMatcher
+from web.result_cache import ResultCache
+from web.stemming import StemmingService
+from web.tokenizer import find_terms
 
 
-class EquipmentStemmer:
+class EquipmentStemmer(StemmingService):
     stemmer_en = stemmer("english")
+    lock = Lock()
 
-    @lru_cache(maxsize=4096)
-    def stem(self, x):
+    def stem_word(self, x):
         return self.stemmer_en.stemWord(x)
 
 
-stopwords = get_stopwords("en")
+stemmer = EquipmentStemmer()
 # nlp = spacy.load("en_core_web_sm")
-appliance_queries = load_queries(CACHE_PATHS["appliance_queries"])
-utensil_queries = load_queries(CACHE_PATHS["utensil_queries"])
-vessel_queries = load_queries(CACHE_PATHS["vessel_queries"])
 
 
-def matches_by_document(index, queries, stemmer):
-    results_by_document = defaultdict(lambda: set())
-    query_hits = index.query_batch(queries, stopwords=stopwords)
-    for result, hits in query_hits:
-        for hit in hits:
-            results_by_document[hit["doc_id"]].add(result)
-    return results_by_document
+# Equipment queries and stopwords are loaded when the first direction query is
+# made, rather than on import, so that workers (and tests) that do not serve
+# direction queries do not pay for them
+@cache
+def load_equipment_queries():
+    return {
+        "appliance": load_queries(CACHE_PATHS["appliance_queries"]),
+        "utensil": load_queries(CACHE_PATHS["utensil_queries"]),
+        "vessel": load_queries(CACHE_PATHS["vessel_queries"]),
+    }
 
 
-@app.route("/directions/query", methods=["POST"])
-def equipment():
-    descriptions = request.form.getlist("descriptions[]")
+@cache
+def load_equipment_matcher():
+    query_matrix = {"equipment": load_equipment_queries()}
+    stopwords = get_stopwords("en")
+    matcher = EquipmentMatcher(query_matrix, stemmer, stopwords)
+    version = hashlib.sha256(
+        json.dumps([query_matrix, stopwords], sort_keys=True).encode()
+    ).hexdigest()
+    return matcher, version
 
-    stemmer = EquipmentStemmer()
-    index = HashedIXSearch(stemmer=stemmer)
-    for doc_id, doc in enumerate(descriptions):
-        index.add(doc_id, doc, ngrams=2, stopwords=stopwords)
-
-    query_matrix = {
-        "equipment": {
-            "appliance": appliance_queries,
-            "utensil": utensil_queries,
-            "vessel": vessel_queries,
-        },
-    }
 
-    # Run the query matrix against the document set and collect entities by doc
+direction_cache = ResultCache("directions")
+
+
+def match_directions(descriptions):
+    equipment_matcher, _ = load_equipment_matcher()
+    index = equipment_matcher.highlighter
+
+    # Scan each document once for the entities in the query matrix; documents
+    # that differ only in casing, punctuation or spacing share a single scan
     entities_by_doc = defaultdict(list)
-    for entity_type in query_matrix:
-        for entity_category in query_matrix[entity_type]:
-            queries = query_matrix[entity_type][entity_category]
-            queries_by_doc = matches_by_document(index, queries, stemmer)
-            for doc_id, queries in queries_by_doc.items():
-                for query in queries:
-                    term = next(index.tokenize(query))
-                    entities_by_doc[doc_id].append(
-                        {
-                            "name": query,
-                            "term": term,
-                            "type": entity_type,
-                            "category": entity_category,
-                        }
-                    )
+    entities_by_terms = {}
+    tokens_by_doc = {}
+    with timed("equipment_scan"):
+        for doc_id, description in enumerate(descriptions):
+            tokens = tokens_by_doc[doc_id] = equipment_matcher.tokenize(description)
+            terms = tuple(term for term, _, _ in tokens)
+            entities = entities_by_terms.get(terms)
+            if entities is None:
+                entities = equipment_matcher.entities(description, tokens)
+                entities_by_terms[terms] = entities
+            if entities:
+                entities_by_doc[doc_id].extend(entities)
 
     # Collect unique verbs found in each input description
     for doc_id, description in enumerate(descriptions):
@@ -87,44 +97,76 @@ def equipment():
                 }
             )
 
-    # Collect all entities for each document and then generate doc markup
-    markup_by_doc = {}
-    for doc_id, entities in entities_by_doc.items():
-        terms = []
-        term_attributes = {}
-        for entity in entities:
-            term, entity_type, entity_category = (
-                entity["term"],
-                entity["type"],
-                entity["category"],
-            )
-            terms.append(term)
-            term_attributes[term] = {
-                "class": f"{entity_type} {entity_category}",
-            }
-        markup_by_doc[doc_id] = index.highlight(
-            doc=descriptions[doc_id],
-            terms=terms,
-            case_sensitive=False,
-            term_attributes=term_attributes,
-        )
-
-    results = []
+    # Collect all entities for each document, mark each occurrence of their
+    # terms within the document's tokens, and then generate doc markup
+    documents = []
+    with timed("equipment_highlight"):
+        for doc_id, entities in entities_by_doc.items():
+            term_attributes = {}
+            for entity in entities:
+                term, entity_type, entity_category = (
+                    entity["term"],
+                    entity["type"],
+                    entity["category"],
+                )
+                term_attributes[term] = {
+                    "class": f"{entity_type} {entity_category}",
+                }
+            spans = [
+                (start, end, term_attributes[term])
+                for term, start, end in find_terms(
+                    tokens_by_doc[doc_id], term_attributes
+                )
+            ]
+            documents.append((descriptions[doc_id], spans))
+        markup_by_doc = dict(zip(entities_by_doc, render_markup_batch(documents)))
+
+    results = {}
     for doc_id, description in enumerate(descriptions):
-        results.append(
-            {
-                "index": doc_id,
-                "description": description,
-                "markup": markup_by_doc.get(doc_id),
-                "entities": [
-                    {
-                        "name": entity["name"],
-                        "type": entity["type"],
-                        "category": entity["category"],
-                    }
-                    for entity in entities_by_doc.get(doc_id, [])
-                    if entity.get("name") is not None
-                ],
-            }
-        )
-    return jsonify(results)
+        results[description] = {
+            "description": description,
+            "markup": markup_by_doc.get(doc_id),
+            "entities": [
+                {
+                    "name": entity["name"],
+                    "type": entity["type"],
+                    "category": entity["category"],
+                }
+                for entity in entities_by_doc.get(doc_id, [])
+                if entity.get("name") is not None
+            ],
+        }
+    return results
+
+
+def fetch_directions(descriptions):
+    # Results are cached per description, for the equipment queries in use
+    _, equipment_version = load_equipment_matcher()
+    return direction_cache.fetch(equipment_version, descriptions, match_directions)
+
+
+def render_directions(descriptions, results):
+    return [
+        {"index": doc_id, **results[description]}
+        for doc_id, description in enumerate(descriptions)
+    ]
+
+
+def query_directions(descriptions):
+    request_lines.observe(len(descriptions), endpoint="directions")
+    results = fetch_directions(descriptions)
+    return render_directions(descriptions, results)
+
+
+@app.route("/directions/query", methods=["POST"])
+def equipment():
+    descriptions = request.form.getlist("descriptions[]")
+    return jsonify(query_directions(descriptions))
+
+
+@app.route("/directions/bulk", methods=["POST"])
+def equipment_bulk():
+    def process(recipes):
+        return [query_directions(descriptions) for descriptions in recipes]
+
+    return stream_results(read_recipes(), process)
@@ -0,0 +1,115 @@
+from datetime import UTC, datetime
+import random
+import threading
+import time
+
+
+class GraphManager:
+    def __init__(self, loader, refresh_interval=3600, jitter=0.1):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.jitter = jitter
+
+        # The current graph is only ever replaced by a single reference
+        # assignment, so readers always observe a complete, fully-built graph
+        self.graph = None
+        self.loaded_at = None
+        self.loaded_at_monotonic = None
+
+        self.builds = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.last_build_duration = None
+        self.last_error = None
+
+        self._build_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._refresher = None
+
+    def ensure_loaded(self):
+        # Only the very first load blocks a request; subsequent builds happen
+        # on the background refresher thread
+        if self.graph is None:
+            with self._build_lock:
+                if self.graph is None:
+                    self._build()
+                    if self.graph is None:
+                        raise RuntimeError(
+                            f"Product graph unavailable: {self.last_error}"
+                        )
+        self.start()
+        return self.graph
+
+    def refresh(self):
+        # Skip the refresh if another build is already in progress
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._build()
+        finally:
+            self._build_lock.release()
+
+    def _build(self):
+        started = time.monotonic()
+        try:
+            graph = self.loader(self.graph)
+        except Exception as e:
+            # Keep serving the last-known-good graph when a rebuild fails
+            self.failures += 1
+            self.last_error = repr(e)
+            print(f"Failed to build product graph: {self.last_error}")
+            return False
+        finally:
+            self.last_build_duration = time.monotonic() - started
+
+        # Loaders return the current graph when the hierarchy has not changed
+        if graph is self.graph:
+            self.unchanged += 1
+            return True
+
+        self.graph = graph
+        self.loaded_at = datetime.now(tz=UTC)
+        self.loaded_at_monotonic = time.monotonic()
+        self.builds += 1
+        self.last_error = None
+        return True
+
+    def next_refresh_delay(self):
+        spread = self.refresh_interval * self.jitter
+        return max(self.refresh_interval + random.uniform(-spread, spread), 0)
+
+    def start(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._stopped.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop,
+            name="product-graph-refresher",
+            daemon=True,
+        )
+        self._refresher.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.next_refresh_delay()):
+            self.refresh()
+
+    def graph_age(self):
+        if self.loaded_at_monotonic is None:
+            return None
+        return time.monotonic() - self.loaded_at_monotonic
+
+    def stats(self):
+        return {
+            "loaded": self.graph is not None,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "graph_age_seconds": self.graph_age(),
+            "last_build_seconds": self.last_build_duration,
+            "builds": self.builds,
+            "unchanged": self.unchanged,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "refresh_interval_seconds": self.refresh_interval,
+        }
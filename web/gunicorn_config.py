@@ -0,0 +1,44 @@
+import gc
+import os
+
+
+bind = os.environ.get("GUNICORN_BIND", ":8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# Load the application -- and build the product graph and equipment matchers --
+# once in the master process, so that forked workers share those objects
+preload_app = True
+
+
+def _build_shared_state(server):
+    from web.app import app
+    from web.directions import load_equipment_matcher
+
+    if not app.graph_manager.refresh():
+        server.log.warning("Product graph not preloaded; workers will load it")
+    load_equipment_matcher()
+
+    # Move all objects that exist before forking into a permanent generation that
+    # the garbage collector ignores; otherwise collections in each worker would
+    # touch their reference counts, and copy every shared page
+    gc.collect()
+    gc.freeze()
+
+
+def when_ready(server):
+    _build_shared_state(server)
+
+
+def on_reload(server):
+    # Sending SIGHUP to the master rebuilds the shared graph before it forks a
+    # replacement set of workers
+    gc.unfreeze()
+    _build_shared_state(server)
+
+
+def post_fork(server, worker):
+    from web.app import app
+
+    # Threads do not survive a fork, so each worker starts its own refresher
+    app.graph_manager.start()
@@ -1,102 +1,237 @@
-from collections import Counter, defaultdict
-from datetime import UTC, datetime, timedelta
-from flask import jsonify, request
-from hashedixsearch import HashedIXSearch
+from collections import defaultdict
+import os
+from time import perf_counter
+
+from flask import abort, jsonify, request
 
 from web.app import app
+from web.bulk import read_recipes, stream_results
+from web.graph_manager import GraphManager
+from web.instrumentation import observe_stage, request_lines, timed
 from web.loader import (
     CACHE_PATHS,
+    HierarchyNotModified,
     retrieve_hierarchy,
     retrieve_stopwords,
 )
-from web.models.product import Product
 from web.models.product_graph import ProductGraph
+from web.models.snapshot import SnapshotError, read_snapshot_header
+from web.markup import render_markup_batch
+from web.preprocessing import original_span, strip_brackets_batch
+from web.profiling import profile_graph_loads
+from web.result_cache import ResultCache
+
+
+def load_product_graph(previous=None):
+    snapshot_path = os.environ.get("GRAPH_SNAPSHOT_PATH")
+
+    # Revalidate the hierarchy that the current graph -- or, on startup, the
+    # snapshot written by another worker -- was built from
+    snapshot_header = None
+    if previous:
+        validators = previous.validators
+    elif snapshot_path:
+        try:
+            snapshot_header = read_snapshot_header(snapshot_path)
+        except SnapshotError:
+            pass
+        validators = snapshot_header["validators"] if snapshot_header else {}
+    else:
+        validators = {}
+
+    # The hierarchy downloads as it is read, so the time taken to fetch it
+    # includes the time spent reading it -- which, when the graph is built from
+    # the response as it arrives, is deducted from the time taken to build it
+    started = perf_counter()
+    try:
+        hierarchy = retrieve_hierarchy(validators=validators)
+    except HierarchyNotModified:
+        observe_stage("hierarchy_fetch", perf_counter() - started)
+        if previous:
+            print("Product hierarchy is unchanged")
+            return previous
+        version = snapshot_header["version"]
+        print(f"Loading unchanged product graph snapshot from {snapshot_path}")
+        with timed("snapshot_load"):
+            return ProductGraph.from_snapshot(snapshot_path, version=version)
+
+    stream, request_seconds = hierarchy, perf_counter() - started
+
+    def fetch_seconds():
+        return request_seconds + getattr(stream, "read_seconds", 0)
+
+    filename = CACHE_PATHS["stopwords"]
+    stopwords = list(retrieve_stopwords(filename))
+
+    # Without cache validators, the hierarchy content identifies the snapshot
+    validators = getattr(hierarchy, "validators", {})
+    if snapshot_path and not validators:
+        hierarchy = list(hierarchy)
+        observe_stage("hierarchy_fetch", fetch_seconds())
+        version = ProductGraph.hierarchy_version(hierarchy, stopwords)
+        try:
+            with timed("snapshot_load"):
+                graph = ProductGraph.from_snapshot(snapshot_path, version=version)
+            print(f"Loaded product graph snapshot from {snapshot_path}")
+            return graph
+        except SnapshotError as e:
+            print(f"Not using product graph snapshot: {e}")
+
+    # Refreshes re-index only the products that have changed since the current
+    # graph was built
+    processes = int(os.environ.get("GRAPH_BUILD_PROCESSES", 1))
+    started, fetched = perf_counter(), fetch_seconds()
+    if previous:
+        stage = "graph_update"
+        graph = previous.update(hierarchy, stopwords, processes=processes)
+    else:
+        stage = "graph_build"
+        graph = ProductGraph(hierarchy, stopwords, processes=processes)
+    build_seconds = perf_counter() - started - (fetch_seconds() - fetched)
+    if hierarchy is stream:
+        observe_stage("hierarchy_fetch", fetch_seconds())
+    observe_stage(stage, build_seconds)
+    graph.validators = validators
+    if snapshot_path:
+        try:
+            graph.save_snapshot(snapshot_path)
+        except OSError as e:
+            print(f"Failed to write product graph snapshot: {e}")
+    return graph
+
+
+ingredient_cache = ResultCache("ingredients")
+
+app.graph_manager = GraphManager(
+    loader=profile_graph_loads(load_product_graph),
+    refresh_interval=float(os.environ.get("GRAPH_REFRESH_INTERVAL", 3600)),
+    jitter=float(os.environ.get("GRAPH_REFRESH_JITTER", 0.1)),
+)
 
 
 @app.before_request
 def preload_ingredient_data():
-    # HACK: Only perform ingredient preloading for the ingredient query URL path
-    if request.path != "/ingredients/query":
+    # HACK: Only perform ingredient preloading for the ingredient query URL paths
+    if request.path not in {"/ingredients/query", "/ingredients/bulk"}:
         return
 
-    # Return cached product graph if it is available and has not yet expired
-    if hasattr(app, "graph"):
-        if datetime.now(tz=UTC) < app.graph_loaded_at + timedelta(hours=1):
-            return
+    # Blocks only until the initial graph is available; refreshes happen in the
+    # background and are swapped-in atomically
+    try:
+        app.graph_manager.ensure_loaded()
+    except RuntimeError as e:
+        abort(503, str(e))
 
-    # Otherwise, attempt to update the product graph
-    hierarchy = retrieve_hierarchy()
 
-    filename = CACHE_PATHS["stopwords"]
-    stopwords = retrieve_stopwords(filename)
+MAX_TOP_K = 50
+
 
-    app.graph = ProductGraph(hierarchy, stopwords)
-    app.graph_loaded_at = datetime.now(tz=UTC)
+def match_ingredients(graph, descriptions, top_k=None):
+    # Filter-out content between parentheses
+    with timed("paren_stripping"):
+        stripped = strip_brackets_batch(descriptions)
+    unadorned_descriptions = [text for text, _ in stripped]
+
+    # Find the best product match for each description, and the span of its
+    # name within the description; optionally, the top-ranked alternatives
+    rankings = {}
+    if top_k:
+        rankings = graph.rank_descriptions(descriptions, stripped, top_k)
+        results = {
+            doc_id: (ranking[0]["product"], ranking[0]["span"])
+            for doc_id, ranking in rankings.items()
+            if not ranking[0]["bracketed"]
+        }
+    else:
+        matches = graph.match_descriptions(descriptions, unadorned_descriptions)
+        results = {
+            doc_id: (product, original_span(stripped[doc_id][1], span))
+            for doc_id, (product, _, span) in matches.items()
+        }
+
+    # Build per-query result metadata
+    markup = defaultdict(lambda: None)
+    metadata = defaultdict(lambda: None)
+    with timed("highlight"):
+        documents = [
+            (descriptions[doc_id], [(*span, None)])
+            for doc_id, (_, span) in results.items()
+        ]
+        markup.update(zip(results, render_markup_batch(documents)))
+    with timed("metadata"):
+        for doc_id, (product, _) in results.items():
+            metadata[doc_id] = product.get_metadata(descriptions[doc_id], graph)
+
+    results = {
+        description: {
+            "product": metadata[doc_id],
+            "query": {
+                "markup": markup[doc_id],
+            },
+        }
+        for doc_id, description in enumerate(descriptions)
+    }
+    if top_k:
+        for doc_id, description in enumerate(descriptions):
+            results[description]["matches"] = [
+                {
+                    "product": match["product"].get_metadata(description, graph),
+                    "score": round(match["score"], 4),
+                    "span": list(match["span"]),
+                }
+                for match in rankings.get(doc_id, [])
+            ]
+    return results
 
 
-def find_product_candidates(descriptions):
-    results = app.graph.product_index.query_batch(
-        descriptions, stopwords=app.graph.stopwords, query_limit=-1
+def fetch_ingredients(graph, descriptions, top_k=None):
+    # Results are cached per description, for the graph that produced them (and
+    # separately for each number of requested alternatives)
+    version = f"{graph.version}:{top_k}" if top_k else graph.version
+    return ingredient_cache.fetch(
+        version, descriptions, lambda misses: match_ingredients(graph, misses, top_k)
     )
-    for description, hits in results:
-        for hit in hits:
-            product = app.graph.products_by_id[hit["doc_id"]]
-            yield product
+
+
+def render_ingredients(descriptions, results):
+    return {
+        "results": {description: results[description] for description in descriptions}
+    }
+
+
+def query_ingredients(graph, descriptions, top_k=None):
+    request_lines.observe(len(descriptions), endpoint="ingredients")
+    results = fetch_ingredients(graph, descriptions, top_k)
+    return render_ingredients(descriptions, results)
+
+
+def parse_top_k(value):
+    if value is None:
+        return None
+    try:
+        top_k = int(value)
+    except ValueError:
+        top_k = 0
+    if not 1 <= top_k <= MAX_TOP_K:
+        abort(400, f"top_k must be an integer between 1 and {MAX_TOP_K}")
+    return top_k
 
 
 @app.route("/ingredients/query", methods=["POST"])
 def ingredients():
     descriptions = request.form.getlist("descriptions[]")
+    top_k = parse_top_k(request.form.get("top_k"))
 
-    # Filter-out content between parentheses
-    unadorned_descriptions = []
-    for description in descriptions:
-        parens, unadorned_description = Counter(), ""
-        for char in description:
-            if char in {"(", "[", "{"}:
-                parens[char] += 1
-            if char in {")", "]", "}"}:
-                parens[char] -= 1
-            if not parens.total():
-                unadorned_description += char
-        unadorned_descriptions.append(unadorned_description)
-
-    # Build a local search index over the product descriptions
-    description_index = HashedIXSearch(stemmer=Product.stemmer)
-    for doc_id, description in enumerate(unadorned_descriptions):
-        description_index.add(doc_id, description)
-
-    # Track the best match for each product
-    results = defaultdict(lambda: None)
-    scores = defaultdict(lambda: 0.0)
-    for candidate in find_product_candidates(descriptions):
-        hits = description_index.query(candidate.name)
-        for hit in hits:
-            doc_id, score, terms = hit["doc_id"], hit["score"], hit["terms"]
-            if score > scores[doc_id]:
-                results[doc_id] = candidate, terms
-                scores[doc_id] = score
+    # Read the graph reference once so that the request sees a consistent graph
+    graph = app.graph_manager.graph
+    return jsonify(query_ingredients(graph, descriptions, top_k))
 
-    # Build per-query result metadata
-    markup = defaultdict(lambda: None)
-    metadata = defaultdict(lambda: None)
-    for doc_id, (product, terms) in results.items():
-        description = descriptions[doc_id]
-        markup[doc_id] = description_index.highlight(
-            doc=description, terms=terms, case_sensitive=False, limit=1
-        )
-        metadata[doc_id] = product.get_metadata(description, app.graph)
-
-    return jsonify(
-        {
-            "results": {
-                description: {
-                    "product": metadata[doc_id],
-                    "query": {
-                        "markup": markup[doc_id],
-                    },
-                }
-                for doc_id, description in enumerate(descriptions)
-            }
-        }
-    )
+
+@app.route("/ingredients/bulk", methods=["POST"])
+def ingredients_bulk():
+    def process(recipes):
+        # Each chunk of recipes is processed against a single consistent graph
+        graph = app.graph_manager.graph
+        return [query_ingredients(graph, descriptions) for descriptions in recipes]
+
+    return stream_results(read_recipes(), process)
@@ -0,0 +1,159 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+# Metrics are held per-process, and rendered in the Prometheus text format
+REGISTRY = []
+
+# Stage durations recorded during the current request, if it is being traced
+request_timings = ContextVar("request_timings", default=None)
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for suffix, labels, value in self.samples():
+            yield f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0, 0]
+            if bucket < len(self.buckets):
+                series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            series = [
+                (key, list(counts), *rest)
+                for key, (counts, *rest) in self.series.items()
+            ]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(float(bound))),)
+                yield "_bucket", labels + le, cumulative
+            yield "_bucket", labels + (("le", "+Inf"),), count
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    # The callback returns either a single value, or (labels, value) pairs
+    def __init__(self, name, documentation, callback, kind="gauge"):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        values = self.callback()
+        if values is None:
+            return
+        if not isinstance(values, (list, tuple)):
+            values = [({}, values)]
+        for labels, value in values:
+            if value is not None:
+                yield "", tuple(sorted(labels.items())), value
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_duration = Histogram(
+    "knowledge_graph_stage_duration_seconds",
+    "Time spent in each processing stage",
+)
+
+request_lines = Histogram(
+    "knowledge_graph_request_lines",
+    "Number of descriptions in each query",
+    buckets=COUNT_BUCKETS,
+)
+line_candidates = Histogram(
+    "knowledge_graph_line_candidates",
+    "Number of candidate products considered for each ingredient description",
+    buckets=COUNT_BUCKETS,
+)
+
+
+def observe_stage(stage, duration):
+    stage_duration.observe(duration, stage=stage)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0) + duration
+
+
+@contextmanager
+def timed(stage):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, perf_counter() - start)
@@ -1,6 +1,8 @@
 import json
 import os
-from urllib.request import urlopen
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
 from web.models.product import Product
 
@@ -18,29 +20,87 @@ def load_queries(filename):
         return [line.strip().lower() for line in f.readlines()]
 
 
+# Stopwords read from each file, along with the file modification time and size
+# that they were read at; the file is re-read only when it changes
+_stopwords_cache = {}
+
+
 def retrieve_stopwords(filename):
-    if not os.path.exists(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
         raise RuntimeError(f"Could not read stopwords from: {filename}")
 
+    validators = stat.st_mtime_ns, stat.st_size
+    cached = _stopwords_cache.get(filename)
+    if cached and cached[0] == validators:
+        return cached[1]
+
     print(f"Reading stopwords from {filename}")
     with open(filename) as f:
-        for line in f.readlines():
-            if line.startswith("#"):
-                continue
-            yield line.strip()
+        stopwords = [line.strip() for line in f.readlines() if not line.startswith("#")]
+    _stopwords_cache[filename] = validators, stopwords
+    return stopwords
+
+
+HIERARCHY_URL = os.environ.get(
+    "HIERARCHY_URL", "http://backend-service/products/hierarchy"
+)
+# Applies to connecting, and to each read of the (streamed) response, so that a
+# stalled backend fails the graph load rather than blocking it indefinitely
+HIERARCHY_TIMEOUT = float(os.environ.get("HIERARCHY_TIMEOUT", 30))
+
+
+class HierarchyNotModified(Exception):
+    pass
+
+
+class HierarchyStream:
+    def __init__(self, response):
+        self.response = response
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        self.validators = {k: v for k, v in validators.items() if v}
+        self.read_seconds = 0
+
+    def __iter__(self):
+        # Parse each record as soon as its line arrives from the socket, so that
+        # indexing can proceed while the remainder of the response downloads;
+        # the time spent waiting for, and parsing, each line is accumulated
+        with self.response as f:
+            started = perf_counter()
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                product = Product(
+                    id=record["id"],
+                    name=record["product"],
+                    frequency=record["recipe_count"],
+                    parent_id=record.get("parent_id"),
+                    substitutes=record.get("substitutes") or (),
+                )
+                self.read_seconds += perf_counter() - started
+                yield product
+                started = perf_counter()
+            self.read_seconds += perf_counter() - started
 
 
-def retrieve_hierarchy():
-    url = "http://backend-service/products/hierarchy"
+def retrieve_hierarchy(url=HIERARCHY_URL, validators=None, timeout=HIERARCHY_TIMEOUT):
     print(f"Reading hierarchy from {url}")
 
-    with urlopen(url) as f:
-        text = f.read().decode("utf-8")
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
 
-    for line in text.splitlines():
-        product = json.loads(line)
-        yield Product(
-            id=product["id"],
-            name=product["product"],
-            frequency=product["recipe_count"],
-        )
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304:
+            raise HierarchyNotModified(url)
+        raise
+    return HierarchyStream(response)
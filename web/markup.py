@@ -0,0 +1,31 @@
+from xml.sax.saxutils import escape
+
+
+def _render_attributes(attributes):
+    return "".join(f' {key}="{value}"' for key, value in (attributes or {}).items())
+
+
+# Renders a description as escaped text, wrapping each of the given character
+# spans -- (start, end, attributes) tuples -- in a <mark> element, in a single
+# pass over the original text.
+#
+# Spans are rendered in order of their start offset, and the longest span is
+# chosen where several start at the same offset; a span that overlaps a span
+# that has already been rendered is omitted, and adjacent spans are rendered as
+# separate elements.
+def render_markup(text, spans):
+    pieces, position = [], 0
+    for start, end, attributes in sorted(spans, key=lambda s: (s[0], -s[1])):
+        if start < position or start >= end:
+            continue
+        pieces.append(escape(text[position:start]))
+        pieces.append(
+            f"<mark{_render_attributes(attributes)}>{escape(text[start:end])}</mark>"
+        )
+        position = end
+    pieces.append(escape(text[position:]))
+    return "".join(pieces)
+
+
+def render_markup_batch(documents):
+    return [render_markup(text, spans) for text, spans in documents]
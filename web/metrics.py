@@ -0,0 +1,192 @@
+import os
+import time
+
+from flask import Response
+
+from web.app import app, started
+from web.instrumentation import Gauge, render, request_timings
+from web.models.product import Product
+
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in {"1", "true", "yes"}
+
+
+def stemmer_cache(statistic):
+    def collect():
+        # The query modules import the application, which imports this module;
+        # their contents are only available once the application has loaded
+        from web.directions import stemmer as equipment_stemmer
+
+        stemmers = {"product": Product.stemmer, "equipment": equipment_stemmer}
+        return [
+            ({"stemmer": name}, stemmer.stats()[statistic])
+            for name, stemmer in stemmers.items()
+        ]
+
+    return collect
+
+
+def result_cache(statistic):
+    def collect():
+        from web.directions import direction_cache
+        from web.ingredients import ingredient_cache
+
+        caches = {"ingredients": ingredient_cache, "directions": direction_cache}
+        return [
+            ({"cache": name}, cache.statistics()[statistic])
+            for name, cache in caches.items()
+        ]
+
+    return collect
+
+
+def startup_statistic(statistic):
+    def collect():
+        return app.startup[statistic]
+
+    return collect
+
+
+def graph_statistic(statistic):
+    def collect():
+        value = app.graph_manager.stats()[statistic]
+        return float(value) if isinstance(value, (bool, int, float)) else None
+
+    return collect
+
+
+def exact_matches(statistic):
+    def collect():
+        graph = app.graph_manager.graph
+        return graph.exact_match_stats()[statistic] if graph else None
+
+    return collect
+
+
+Gauge(
+    "knowledge_graph_stemmer_cache_hits_total",
+    "Stemmer cache hits",
+    stemmer_cache("hits"),
+    kind="counter",
+)
+Gauge(
+    "knowledge_graph_stemmer_cache_misses_total",
+    "Stemmer cache misses",
+    stemmer_cache("misses"),
+    kind="counter",
+)
+Gauge(
+    "knowledge_graph_stemmer_cache_entries",
+    "Number of words held in the stemmer cache",
+    stemmer_cache("cache_entries"),
+)
+Gauge(
+    "knowledge_graph_stemmer_vocabulary_entries",
+    "Number of words in the precomputed stemmer vocabulary",
+    stemmer_cache("vocabulary_entries"),
+)
+for statistic, documentation in (
+    ("hits", "Results served from the local result cache"),
+    ("shared_hits", "Results served from the shared result cache"),
+    ("misses", "Results computed after a result cache miss"),
+    ("errors", "Shared result cache errors"),
+):
+    Gauge(
+        f"knowledge_graph_result_cache_{statistic}_total",
+        documentation,
+        result_cache(statistic),
+        kind="counter",
+    )
+Gauge(
+    "knowledge_graph_result_cache_entries",
+    "Number of results held in the local result cache",
+    result_cache("entries"),
+)
+Gauge(
+    "knowledge_graph_result_cache_bytes",
+    "Approximate size of the results held in the local result cache",
+    result_cache("bytes"),
+)
+Gauge(
+    "knowledge_graph_exact_match_hits_total",
+    "Ingredient lines matched by exact product name lookup (for the current graph)",
+    exact_matches("hits"),
+    kind="counter",
+)
+Gauge(
+    "knowledge_graph_exact_match_lookups_total",
+    "Ingredient lines considered for exact product name lookup",
+    exact_matches("lookups"),
+    kind="counter",
+)
+Gauge(
+    "knowledge_graph_exact_match_hit_ratio",
+    "Fraction of ingredient lines matched by exact product name lookup",
+    exact_matches("hit_rate"),
+)
+Gauge(
+    "knowledge_graph_startup_import_seconds",
+    "Time taken to import the application",
+    startup_statistic("import_seconds"),
+)
+Gauge(
+    "knowledge_graph_startup_first_request_seconds",
+    "Time from application import until the first request was served",
+    startup_statistic("first_request_seconds"),
+)
+Gauge(
+    "knowledge_graph_graph_loaded",
+    "Whether a product graph is available",
+    graph_statistic("loaded"),
+)
+Gauge(
+    "knowledge_graph_graph_age_seconds",
+    "Time since the current product graph was loaded",
+    graph_statistic("graph_age_seconds"),
+)
+Gauge(
+    "knowledge_graph_graph_build_seconds",
+    "Duration of the most recent product graph build",
+    graph_statistic("last_build_seconds"),
+)
+for statistic, documentation in (
+    ("builds", "Product graph builds"),
+    ("unchanged", "Product graph refreshes that found an unchanged hierarchy"),
+    ("failures", "Failed product graph builds"),
+):
+    Gauge(
+        f"knowledge_graph_graph_{statistic}_total",
+        documentation,
+        graph_statistic(statistic),
+        kind="counter",
+    )
+
+
+@app.before_request
+def start_request_timings():
+    request_timings.set({} if SERVER_TIMING else None)
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = request_timings.get()
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={duration * 1000:.2f}" for stage, duration in timings.items()
+        )
+    return response
+
+
+@app.after_request
+def record_first_request(response):
+    if app.startup["first_request_seconds"] is None:
+        app.startup["first_request_seconds"] = time.perf_counter() - started
+        print(
+            f"Served first request {app.startup['first_request_seconds']:.2f}s "
+            f"after startup (imports took {app.startup['import_seconds']:.2f}s)"
+        )
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(render(), mimetype="text/plain; version=0.0.4")
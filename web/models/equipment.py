@@ -0,0 +1,52 @@
+from hashedixsearch import HashedIXSearch
+
+from web.tokenizer import ngrams, tokenize
+
+
+class EquipmentMatcher:
+    def __init__(self, query_matrix, stemmer, stopwords, ngrams=2):
+        self.stemmer = stemmer
+        self.stopwords = frozenset(stopwords)
+        self.ngrams = ngrams
+        self.highlighter = HashedIXSearch(stemmer=stemmer)
+
+        # Compile each query into a table keyed by its stemmed leading term; this
+        # is the only term of a query that HashedIXSearch.query matches against
+        # (with its default query_limit), and queries whose term is longer than
+        # the description n-gram size could never match a description
+        self.phrases = {}
+        rank = 0
+        for entity_type, categories in query_matrix.items():
+            for entity_category, queries in categories.items():
+                for query in queries:
+                    rank += 1
+                    term = next(self.highlighter.tokenize(query, stopwords=stopwords))
+                    if not term or len(term) > ngrams:
+                        continue
+                    self.phrases.setdefault(term, []).append(
+                        {
+                            "name": query,
+                            "term": next(self.highlighter.tokenize(query)),
+                            "type": entity_type,
+                            "category": entity_category,
+                            "rank": rank,
+                        }
+                    )
+
+    def tokenize(self, description):
+        return tokenize(description, stemmer=self.stemmer)
+
+    def scan(self, description, tokens=None):
+        if tokens is None:
+            tokens = self.tokenize(description)
+        for n in range(1, self.ngrams + 1):
+            for terms, start, end in ngrams(tokens, n, self.stopwords):
+                for phrase in self.phrases.get(terms, []):
+                    yield dict(phrase, span=(start, end))
+
+    def entities(self, description, tokens=None):
+        # Report each matching query once, in query matrix order
+        entities = {}
+        for match in self.scan(description, tokens):
+            entities.setdefault(match["rank"], match)
+        return [entities[rank] for rank in sorted(entities)]
@@ -1,18 +1,20 @@
-from functools import lru_cache
+from functools import cache
 import json
+from threading import Lock
 
 from hashedixsearch import HashedIXSearch
-import inflect
 from snowballstemmer import stemmer
 from unidecode import unidecode
 
+from web.stemming import StemmingService
+
 
 class Product:
-    class ProductStemmer:
+    class ProductStemmer(StemmingService):
         stemmer_en = stemmer("english")
+        lock = Lock()
 
-        @lru_cache(maxsize=4096)
-        def stem(self, x):
+        def stem_word(self, x):
             x = unidecode(x)
             # note: snowball stemmer doesn't provide (or aim to provide) idempotency
             # when applied in multiple rounds to any given term.  while we could
@@ -24,12 +26,22 @@ class Product:
             return self.stemmer_en.stemWord(self.stemmer_en.stemWord(x))
 
     stemmer = ProductStemmer()
-    inflector = inflect.engine()
 
-    def __init__(self, name, id=None, frequency=0):
+    @staticmethod
+    @cache
+    def get_inflector():
+        # Importing inflect takes several seconds; inflections are only needed
+        # when a product graph is built, rather than loaded from a snapshot
+        import inflect
+
+        return inflect.engine()
+
+    def __init__(self, name, id=None, frequency=0, parent_id=None, substitutes=()):
         self.name = name
         self.id = id
         self.frequency = max(frequency, 1)
+        self.parent_id = parent_id
+        self.substitutes = tuple(substitutes)
         self.stopwords = []
 
     def __add__(self, other):
@@ -62,21 +74,27 @@ class Product:
         tokens = self.tokenize()
         return " ".join(tokens)
 
-    @lru_cache(maxsize=4096)
-    def _static_metadata(self, graph):
-        singular = Product.inflector.singular_noun(self.name)
-        singular = singular or self.name
-        plural = Product.inflector.plural_noun(singular)
+    @staticmethod
+    def inflect_names(names):
+        inflector = Product.get_inflector()
+        inflections = []
+        for name in names:
+            singular = inflector.singular_noun(name)
+            singular = singular or name
+            plural = inflector.plural_noun(singular)
+            inflections.append((singular, plural))
+        return inflections
+
+    def inflections(self):
+        return Product.inflect_names([self.name])[0]
 
+    def get_metadata(self, description, graph):
+        singular, plural = self.inflections()
+        is_plural = plural in description.lower()
         return {
             "id": self.id,
             "singular": singular,
             "plural": plural,
+            "is_plural": is_plural,
+            "product": plural if is_plural else singular,
         }
-
-    def get_metadata(self, description, graph):
-        metadata = self._static_metadata(graph)
-        is_plural = metadata["plural"] in description.lower()
-        metadata["is_plural"] = is_plural
-        metadata["product"] = metadata["plural" if is_plural else "singular"]
-        return metadata
@@ -1,62 +1,435 @@
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+import hashlib
+import heapq
+from multiprocessing import get_context
+
 from hashedixsearch import HashedIXSearch
 
+from web.instrumentation import line_candidates, timed
 from web.models.product import Product
+from web.models.product_relations import ProductRelations
+from web.models.product_store import ProductStore
+from web.models.snapshot import (
+    index_sections,
+    read_snapshot,
+    restore_index,
+    write_snapshot,
+)
+from web.preprocessing import original_span
+from web.tokenizer import ngrams, tokenize
+
+
+def _digest_products(digest, products):
+    for product in products:
+        digest.update(f"{product.id}\t{product.name}\t{product.frequency}".encode())
+        digest.update(f"\t{product.parent_id}\t{product.substitutes}\n".encode())
+        yield product
+
+
+def _relations(products):
+    for product in products:
+        if product.parent_id is not None or product.substitutes:
+            yield product.id, product.parent_id, product.substitutes
+
+
+def _query_terms(tokens, size, stopwords):
+    # The terms of a product search for a list of tokens, in query order: each
+    # n-gram without stopwords, longest first, of up to size tokens
+    for n in range(size, 0, -1):
+        for terms, _, _ in ngrams(tokens, n, stopwords):
+            yield terms
+
+
+def _digest_stopwords(digest, stopwords):
+    digest.update(b"\0")
+    for stopword in stopwords:
+        digest.update(f"{stopword}\n".encode())
+
+
+_CHUNKS_IN_FLIGHT = 32
+
+# Tokenization and stemming during graph builds is performed in chunks by these
+# functions, which may run in worker processes; their results are merged into
+# the graph in input order, so that parallel and serial builds are identical
+
+
+def _index_terms(products, stopwords):
+    index = HashedIXSearch(stemmer=Product.stemmer)
+    results = []
+    for product in products:
+        product.stopwords = stopwords
+        doc = product.to_doc()
+        tokens = index.tokenize(doc=doc)
+        terms = []
+        while term := next(tokens):
+            terms.append(term)
+        results.append(terms)
+    return results
+
+
+def _leading_terms(names):
+    index = HashedIXSearch(stemmer=Product.stemmer)
+    return [next(index.tokenize(name)) for name in names]
+
+
+def _stopword_terms(stopwords, clearwords):
+    index = HashedIXSearch(stemmer=Product.stemmer)
+    return [
+        [term for term in index.tokenize(doc=stopword, stopwords=clearwords) if term]
+        for stopword in stopwords
+    ]
+
+
+def _stem_words(words):
+    return Product.stemmer.stem_many(words)
+
+
+def _map_chunks(executor, function, chunks, *args):
+    # Applies the function to each chunk -- using the executor, if any, with a
+    # bounded number of chunks in flight -- and yields each chunk along with its
+    # results, in order
+    if executor is None:
+        for chunk in chunks:
+            yield chunk, function(chunk, *args)
+        return
+
+    pending = deque()
+    for chunk in chunks:
+        pending.append((chunk, executor.submit(function, chunk, *args)))
+        if len(pending) >= _CHUNKS_IN_FLIGHT:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+
+def _flatten(chunk_results):
+    for _, results in chunk_results:
+        yield from results
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 class ProductGraph:
-    def __init__(self, products, stopwords=None):
+    BUILD_CHUNK_SIZE = 1000
+
+    # The fraction of products that may change (or have been removed) in an
+    # update, beyond which a new graph is built instead
+    UPDATE_MAX_CHANGES = 0.25
+
+    # The maximum number of candidate products considered for a description;
+    # candidates with the longest name terms are considered first
+    MAX_LINE_CANDIDATES = 1000
+
+    def __init__(self, products, stopwords=None, processes=1):
         stopwords = list(stopwords or [])
-        self.products_by_id = {}
+        self.validators = {}
+        self.source_stopwords = stopwords
         self.product_index = HashedIXSearch(stemmer=Product.stemmer)
-        self.build_product_index(products, stopwords)
-        self.stopwords = list(self.process_stopwords(stopwords))
-        self.stopword_index = self.build_stopword_index()
+        clearwords = self.get_clearwords()
+
+        executor = None
+        if processes > 1:
+            # Builds may start while other threads hold locks (such as that of
+            # the stemmer), which forked workers would inherit in a locked state
+            executor = ProcessPoolExecutor(
+                max_workers=processes, mp_context=get_context("forkserver")
+            )
+        try:
+            self.build_product_index(products, stopwords, clearwords, executor)
+            self.build_inflections(executor)
+            self.vocabulary = self.build_vocabulary(stopwords, executor)
+            self.stopwords = list(
+                self.process_stopwords(stopwords, clearwords, executor)
+            )
+            self.stopword_index = self.build_stopword_index()
+            self.name_terms = self.build_name_terms(executor)
+            self.exact_terms = self.build_exact_terms()
+            self.name_index = self.build_name_index()
+        finally:
+            if executor:
+                executor.shutdown()
+
+    @classmethod
+    def from_snapshot(cls, path, version=None):
+        header, sections = read_snapshot(path, version=version)
+
+        graph = cls.__new__(cls)
+        graph.version = header["version"]
+        graph.validators = header.get("validators", {})
+        graph.source_stopwords = sections["source_stopwords"]
+        graph.product_stopwords = sections["product_stopwords"]
+        graph.stopwords = sections["stopwords"]
+        graph.products_by_id = ProductStore.from_sections(
+            sections["products"], stopwords=graph.product_stopwords
+        )
+        graph.product_index = restore_index(
+            HashedIXSearch(stemmer=Product.stemmer), sections["product_index"]
+        )
+        graph.stopword_index = restore_index(
+            HashedIXSearch(), sections["stopword_index"]
+        )
+        graph.name_terms = sections["name_terms"]
+        graph.exact_terms = graph.build_exact_terms()
+        graph.name_index = graph.build_name_index()
+        graph.relations = ProductRelations.from_sections(sections["relations"])
+        graph.vocabulary = sections["vocabulary"]
+        Product.stemmer.use_vocabulary(graph.vocabulary)
+        return graph
+
+    def save_snapshot(self, path):
+        sections = {
+            "products": self.products_by_id.to_sections(),
+            "source_stopwords": self.source_stopwords,
+            "product_stopwords": self.product_stopwords,
+            "stopwords": self.stopwords,
+            "product_index": index_sections(self.product_index),
+            "stopword_index": index_sections(self.stopword_index),
+            "name_terms": self.name_terms,
+            "vocabulary": self.vocabulary,
+            "relations": self.relations.to_sections(),
+        }
+        write_snapshot(path, self.version, sections, validators=self.validators)
+
+    @staticmethod
+    def hierarchy_version(products, stopwords):
+        digest = hashlib.sha256()
+        for product in _digest_products(digest, products):
+            pass
+        _digest_stopwords(digest, stopwords)
+        return digest.hexdigest()
+
+    def update(self, products, stopwords=None, processes=1):
+        # Returns a graph for an updated hierarchy.  Only the products whose
+        # hierarchy records have changed are re-indexed, in a copy of this graph
+        # that shares its unchanged structures -- this graph is not modified, and
+        # can continue to serve requests meanwhile.  When the stopwords or much
+        # of the hierarchy have changed, a new graph is built instead
+        stopwords = list(stopwords or [])
+        digest = hashlib.sha256()
+        hierarchy = list(_digest_products(digest, products))
+        _digest_stopwords(digest, stopwords)
+
+        previous = self.products_by_id.records()
+        current = {}
+        for product in hierarchy:
+            current.setdefault(product.id, []).append((product.name, product.frequency))
+        changed = [
+            product_id
+            for product_id in {**previous, **current}
+            if previous.get(product_id) != current.get(product_id)
+        ]
+
+        # Removed products leave unused ordinals behind until the next rebuild
+        store = self.products_by_id
+        removed = len(store.ids) - len(store) + len(previous.keys() - current.keys())
+        if stopwords != self.source_stopwords:
+            print("Rebuilding product graph (stopwords changed)")
+            return ProductGraph(hierarchy, stopwords, processes=processes)
+        if len(changed) + removed > self.UPDATE_MAX_CHANGES * len(current):
+            print(f"Rebuilding product graph ({len(changed)} products changed)")
+            return ProductGraph(hierarchy, stopwords, processes=processes)
+
+        graph = ProductGraph.__new__(ProductGraph)
+        graph.__dict__.update(self.__dict__)
+        graph.validators = {}
+        graph.version = digest.hexdigest()
+        graph.products_by_id = store = store.copy()
+        graph.name_terms = list(self.name_terms)
+        graph.product_index = HashedIXSearch(stemmer=Product.stemmer)
+        index = graph.product_index.index
+        index._terms = dict(self.product_index.index._terms)
+        index._documents = Counter(self.product_index.index._documents)
+
+        # Tokenize the previous and current records of each changed product, and
+        # adjust its postings by the difference in term occurrences
+        groups = []
+        for product_id in changed:
+            for group in previous.get(product_id, []), current.get(product_id, []):
+                groups.append(
+                    [Product(name, product_id, count) for name, count in group]
+                )
+        records = [record for group in groups for record in group]
+        terms = iter(_index_terms(records, self.product_stopwords))
+        occurrences = []
+        for group in groups:
+            counts = Counter()
+            for record in group:
+                for term in next(terms):
+                    counts[term] += record.frequency
+            occurrences.append(counts)
+
+        copied, unordered = set(), set()
+        for product_id, before, after in zip(
+            changed, occurrences[::2], occurrences[1::2]
+        ):
+            if product_id in current:
+                ordinal = store.replace(product_id, current[product_id])
+            else:
+                ordinal = store.remove(product_id)
+
+            for term in before.keys() | after.keys():
+                delta = after[term] - before[term]
+                if not delta:
+                    continue
+                if term not in copied:
+                    index._terms[term] = Counter(index._terms.get(term, {}))
+                    copied.add(term)
+                postings = index._terms.setdefault(term, Counter())
+                postings[ordinal] = postings.get(ordinal, 0) + delta
+                if postings[ordinal] <= 0:
+                    del postings[ordinal]
+                if not postings:
+                    del index._terms[term]
+            unordered.update(after)
+            if after:
+                index._documents[ordinal] = sum(after.values())
+            else:
+                index._documents.pop(ordinal, None)
+
+            name = store.names[ordinal]
+            name_term = _leading_terms([name])[0] if name is not None else ()
+            if ordinal < len(graph.name_terms):
+                graph.name_terms[ordinal] = name_term
+            else:
+                graph.name_terms.append(name_term)
 
-    def build_product_index(self, products, stopwords):
-        clearwords = set(self.get_clearwords())
+        # Postings are kept in the order in which their products first appear in
+        # the hierarchy, as in a newly-built graph, so that ties between
+        # candidates are resolved identically.  Changed products may have been
+        # added or moved, so the postings of their terms are re-ordered; all
+        # postings are, should unchanged products have been re-ordered
+        unchanged = previous.keys() & current.keys() - set(changed)
+        if [p for p in previous if p in unchanged] != [
+            p for p in current if p in unchanged
+        ]:
+            unordered = index._terms.keys()
+        if unordered:
+            positions = {store.ordinals[p]: n for n, p in enumerate(current)}
+        for term in list(unordered):
+            postings = index._terms.get(term)
+            if postings:
+                ordered = sorted(postings.items(), key=lambda item: positions[item[0]])
+                index._terms[term] = Counter(dict(ordered))
+
+        store.set_records(hierarchy)
+        store.inflect()
+        graph.relations = ProductRelations.build(
+            store.ordinals, len(store.ids), _relations(hierarchy), store.order()
+        )
+
+        # Stem the words of new product names, and re-validate the stopwords
+        # (which depend on the exact-match terms of the index)
+        words = set()
+        for product_id in changed:
+            for name, _ in current.get(product_id, []):
+                words.update(term for term, _, _ in tokenize(name))
+        words = sorted(words - graph.vocabulary.keys())
+        graph.vocabulary = dict(self.vocabulary)
+        graph.vocabulary.update(zip(words, _stem_words(words)))
+        Product.stemmer.use_vocabulary(graph.vocabulary)
+
+        clearwords = self.get_clearwords()
+        graph.stopwords = list(graph.process_stopwords(stopwords, clearwords))
+        if graph.stopwords != self.stopwords:
+            graph.stopword_index = graph.build_stopword_index()
+        graph.exact_terms = graph.build_exact_terms()
+        graph.name_index = graph.build_name_index()
+        print(f"Updated product graph ({len(changed)} products changed)")
+        return graph
+
+    def build_product_index(self, products, stopwords, clearwords=None, executor=None):
+        if clearwords is None:
+            clearwords = self.get_clearwords()
+        clearwords = set(clearwords)
         product_stopwords = []
         for stopword in stopwords or []:
             if stopword not in clearwords:
                 product_stopwords.append(stopword)
+        self.product_stopwords = product_stopwords
+        self.products_by_id = ProductStore(stopwords=product_stopwords)
 
-        count = 0
-        for product in products:
-            count += 1
-            if count % 1000 == 0:
-                print(f"- {count} documents indexed")
-
-            product.stopwords = product_stopwords
-            self.product_index.add(
-                doc_id=product.id,
-                doc=product.to_doc(),
-                count=product.frequency,
-            )
-            if product.id not in self.products_by_id:
-                self.products_by_id[product.id] = product
-            else:
-                self.products_by_id[product.id] += product
+        # The version identifies the hierarchy (and stopwords) that the graph was
+        # built from; it is computed in the same way as hierarchy_version
+        digest = hashlib.sha256()
+
+        count, relations, merged = 0, [], set()
+        chunks = _chunks(_digest_products(digest, products), self.BUILD_CHUNK_SIZE)
+        for chunk, terms in _map_chunks(
+            executor, _index_terms, chunks, product_stopwords
+        ):
+            for product, product_terms in zip(chunk, terms):
+                count += 1
+                if count % 1000 == 0:
+                    print(f"- {count} documents indexed")
+
+                product.stopwords = product_stopwords
+                products = len(self.products_by_id.ids)
+                ordinal = self.products_by_id.add(product)
+                relations.extend(_relations([product]))
+                for term in product_terms:
+                    self.product_index.index.add_term_occurrence(
+                        term, ordinal, count=product.frequency
+                    )
+                if len(self.products_by_id.ids) == products:
+                    merged.update(product_terms)
         print(f"- {count} documents indexed")
 
-    def get_clearwords(self):
+        # Postings are ordered by product ordinal -- the order in which products
+        # first appear in the hierarchy -- which the records of merged products
+        # may not have followed
+        index = self.product_index.index
+        for term in merged:
+            index._terms[term] = Counter(dict(sorted(index._terms[term].items())))
+
+        # Parent and substitute relations may refer to products that appear
+        # later in the hierarchy, so they are resolved once indexing completes
+        self.relations = ProductRelations.build(
+            self.products_by_id.ordinals,
+            len(self.products_by_id.ids),
+            relations,
+            self.products_by_id.order(),
+        )
+
+        _digest_stopwords(digest, stopwords or [])
+        self.version = digest.hexdigest()
+
+    @staticmethod
+    @cache
+    def get_clearwords():
+        # The clear-words file is read once per process, rather than per build or
+        # refresh of the graph
+        index, clearwords = HashedIXSearch(stemmer=Product.stemmer), []
         with open("web/data/clear-words.txt") as f:
             for line in f.readlines():
                 if line.startswith("#"):
                     continue
                 line = line.strip().lower()
-                for term in self.product_index.tokenize(line):
+                for term in index.tokenize(line):
                     if not term:
                         continue
-                    yield term[0]
-
-    def process_stopwords(self, stopwords):
-        clearwords = list(self.get_clearwords())
-        for stopword in stopwords:
-            for term in self.product_index.tokenize(
-                doc=stopword,
-                stopwords=clearwords,
-            ):
-                if not term:
-                    continue
+                    clearwords.append(term[0])
+        return tuple(clearwords)
+
+    def process_stopwords(self, stopwords, clearwords=None, executor=None):
+        if clearwords is None:
+            clearwords = self.get_clearwords()
+        chunks = _chunks(stopwords, self.BUILD_CHUNK_SIZE)
+        terms = _flatten(_map_chunks(executor, _stopword_terms, chunks, clearwords))
+        for stopword, stopword_terms in zip(stopwords, terms):
+            for term in stopword_terms:
                 if self.product_index.query_exact(term):
                     continue
                 yield stopword
@@ -67,6 +440,257 @@ class ProductGraph:
             index.add(doc_id, stopword)
         return index
 
+    def build_inflections(self, executor=None):
+        # Inflecting product names is relatively slow, so the singular and plural
+        # form of each product is computed once per graph, rather than per request
+        self.products_by_id.inflect(executor=executor)
+
+    def build_vocabulary(self, stopwords, executor=None):
+        # Stem each word of the product names (and stopwords) once, so that the
+        # stems of known words are always available without a cache lookup
+        words = set()
+        for text in [*self.products_by_id.names, *stopwords]:
+            words.update(term for term, _, _ in tokenize(text))
+        words = sorted(words)
+        chunks = _chunks(words, self.BUILD_CHUNK_SIZE)
+        stems = _flatten(_map_chunks(executor, _stem_words, chunks))
+        vocabulary = dict(zip(words, stems))
+        Product.stemmer.use_vocabulary(vocabulary)
+        return vocabulary
+
+    def build_name_terms(self, executor=None):
+        # The leading (longest) term of each product name, by product ordinal; a
+        # product must share this term with a description in order to match it
+        chunks = _chunks(self.products_by_id.names, self.BUILD_CHUNK_SIZE)
+        return list(_flatten(_map_chunks(executor, _leading_terms, chunks)))
+
+    def build_exact_terms(self):
+        # Descriptions that consist of exactly the name term of a product can be
+        # matched to it without a search, provided that no other product shares
+        # that term (no other candidate can match a longer term) and that the
+        # search would find the product (the term is indexed, and contains no
+        # stopwords that would be omitted from the query)
+        self.exact_match_hits, self.exact_match_lookups = 0, 0
+        counts = Counter(self.name_terms)
+        stopwords = set(self.stopwords)
+        index = self.product_index.index
+        exact_terms = {}
+        for ordinal, term in enumerate(self.name_terms):
+            if not term or counts[term] > 1 or stopwords.intersection(term):
+                continue
+            if term in index and ordinal in index.get_documents(term):
+                exact_terms[term] = ordinal
+        return exact_terms
+
+    def build_name_index(self):
+        # The ordinals of the products that have each name term, in the order in
+        # which the products first appear in the hierarchy
+        name_index = {}
+        for ordinal in self.products_by_id.order():
+            term = self.name_terms[ordinal]
+            if term:
+                name_index.setdefault(term, []).append(ordinal)
+        return name_index
+
+    def exact_match_stats(self):
+        lookups = self.exact_match_lookups
+        return {
+            "hits": self.exact_match_hits,
+            "lookups": lookups,
+            "hit_rate": self.exact_match_hits / lookups if lookups else None,
+            "entries": len(self.exact_terms),
+        }
+
+    def ngram_positions(self, terms):
+        # The token index of the first occurrence of each n-gram in a sequence of
+        # terms, longest n-grams first
+        positions = {}
+        for n in range(self.product_index.ngrams, 0, -1):
+            for index in range(len(terms) - n + 1):
+                end = index + n
+                positions.setdefault(terms[index:end], index)
+        return positions
+
+    def ngram_spans(self, tokens):
+        # The span of the first occurrence of each n-gram in a list of tokens
+        terms = tuple(term for term, _, _ in tokens)
+        return {
+            term: (tokens[index][1], tokens[index + len(term) - 1][2])
+            for term, index in self.ngram_positions(terms).items()
+        }
+
+    def find_candidates(self, terms, query_tokens, stopwords):
+        # The products named by any of the terms that a search for the query
+        # tokens would find, in the order that the search would rank them: by the
+        # length and then the frequency of the first query term that each
+        # contains, and then in the order found.  Products are looked-up by name
+        # term rather than searched for, so that the work per description is
+        # bounded by its n-grams (and MAX_LINE_CANDIDATES) rather than by the
+        # number of products that share its words
+        candidates, limit = [], self.MAX_LINE_CANDIDATES
+        for term in terms:
+            candidates.extend(self.name_index.get(term, ()))
+            if len(candidates) >= limit:
+                del candidates[limit:]
+                break
+        if not candidates:
+            return []
+
+        postings = self.product_index.index._terms
+        keys, found_terms, remaining = {}, {}, set(candidates)
+        query_terms = _query_terms(query_tokens, self.product_index.ngrams, stopwords)
+        for position, term in enumerate(query_terms):
+            documents = postings.get(term)
+            if not documents:
+                continue
+            found = [ordinal for ordinal in remaining if ordinal in documents]
+            for ordinal in found:
+                keys[ordinal] = -len(term), -documents[ordinal], position, 0
+                found_terms[ordinal] = term
+            remaining.difference_update(found)
+            if not remaining:
+                break
+
+        # Products found by the same query term, with equal frequencies, are
+        # ranked in posting order
+        tied = {}
+        for ordinal, key in keys.items():
+            tied.setdefault(key, []).append(ordinal)
+        for key, ordinals in tied.items():
+            if len(ordinals) > 1:
+                ordinals = set(ordinals)
+                documents = postings[found_terms[next(iter(ordinals))]]
+                ranked = (ordinal for ordinal in documents if ordinal in ordinals)
+                for rank, ordinal in enumerate(ranked):
+                    keys[ordinal] = *key[:3], rank
+        return sorted(keys, key=keys.get)
+
+    def match_descriptions(self, descriptions, unadorned_descriptions):
+        # Tokenize each description once; descriptions without brackets that are
+        # exactly a product name term are matched immediately.  The remainder are
+        # grouped by their terms, so that descriptions differing only in casing,
+        # punctuation or spacing share a single candidate search.  Each match has
+        # the span of the first occurrence of its term in the unadorned text
+        matches, groups = {}, {}
+        with timed("tokenize"):
+            for doc_id, unadorned in enumerate(unadorned_descriptions):
+                tokens = tokenize(unadorned, stemmer=Product.stemmer)
+                terms = tuple(term for term, _, _ in tokens)
+                if unadorned == descriptions[doc_id]:
+                    ordinal = self.exact_terms.get(terms)
+                    if ordinal is not None:
+                        view = self.products_by_id.view(ordinal)
+                        span = tokens[0][1], tokens[-1][2]
+                        matches[doc_id] = view, [self.name_terms[ordinal]], span
+                        continue
+                    query_tokens = tokens
+                else:
+                    query_tokens = tokenize(
+                        descriptions[doc_id], stemmer=Product.stemmer
+                    )
+                key = terms, tuple(term for term, _, _ in query_tokens)
+                group = groups.setdefault(key, (query_tokens, []))
+                group[1].append((doc_id, tokens))
+        self.exact_match_hits += len(matches)
+        self.exact_match_lookups += len(descriptions)
+
+        stopwords = frozenset(self.stopwords)
+        with timed("candidates"):
+            searches = []
+            for (terms, _), (query_tokens, lines) in groups.items():
+                positions = self.ngram_positions(terms)
+                candidates = self.find_candidates(positions, query_tokens, stopwords)
+                searches.append((positions, candidates, lines))
+
+        # Score the candidate products for each group of descriptions; the first
+        # candidate with the longest name term wins.  Descriptions are matched
+        # independently, so that results can be cached per line
+        with timed("scoring"):
+            for positions, candidates, lines in searches:
+                for _ in lines:
+                    line_candidates.observe(len(candidates))
+                if not candidates:
+                    continue
+                ordinal = max(candidates, key=lambda o: len(self.name_terms[o]))
+                view, term = self.products_by_id.view(ordinal), self.name_terms[ordinal]
+                start = positions[term]
+                end = start + len(term) - 1
+                for doc_id, tokens in lines:
+                    matches[doc_id] = view, [term], (tokens[start][1], tokens[end][2])
+        return matches
+
+    def rank_descriptions(self, descriptions, stripped_descriptions, top_k):
+        # Like match_descriptions, but retains the top_k candidates for each
+        # description, using a bounded heap per line.  Candidates named outside of
+        # brackets rank first (and the best of those is the match_descriptions
+        # result); candidates named only within brackets rank after them
+        lines, query_tokens_by_doc = [], []
+        with timed("tokenize"):
+            for description, (text, segments) in zip(
+                descriptions, stripped_descriptions
+            ):
+                tokens = tokenize(text, stemmer=Product.stemmer)
+                spans = self.ngram_spans(tokens), len(tokens)
+                if text == description:
+                    lines.append((spans, spans, segments))
+                    query_tokens_by_doc.append(tokens)
+                    continue
+                query_tokens = tokenize(description, stemmer=Product.stemmer)
+                bracketed = self.ngram_spans(query_tokens), len(query_tokens)
+                lines.append((spans, bracketed, segments))
+                query_tokens_by_doc.append(query_tokens)
+
+        stopwords = frozenset(self.stopwords)
+        with timed("candidates"):
+            results = [
+                self.find_candidates(
+                    dict.fromkeys([*spans, *bracketed_spans]), query_tokens, stopwords
+                )
+                for ((spans, _), (bracketed_spans, _), _), query_tokens in zip(
+                    lines, query_tokens_by_doc
+                )
+            ]
+
+        rankings = {}
+        with timed("scoring"):
+            for doc_id, candidates in enumerate(results):
+                (spans, _), _, _ = lines[doc_id]
+                heap = []
+                for rank, ordinal in enumerate(candidates):
+                    term = self.name_terms[ordinal]
+                    key = (int(term in spans), len(term), -rank)
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, (key, ordinal))
+                    else:
+                        heapq.heappushpop(heap, (key, ordinal))
+                line_candidates.observe(len(candidates))
+                if heap:
+                    ranked = sorted(heap, reverse=True)
+                    rankings[doc_id] = self._describe_ranking(ranked, lines[doc_id])
+        return rankings
+
+    def _describe_ranking(self, ranked, line):
+        (spans, token_count), (bracketed_spans, bracketed_count), segments = line
+        ranking = []
+        for (unbracketed, length, _), ordinal in ranked:
+            term = self.name_terms[ordinal]
+            if unbracketed:
+                span = original_span(segments, spans[term])
+                score = length / token_count
+            else:
+                span = bracketed_spans[term]
+                score = length / bracketed_count
+            ranking.append(
+                {
+                    "product": self.products_by_id.view(ordinal),
+                    "term": term,
+                    "score": min(score, 1.0),
+                    "span": span,
+                    "bracketed": not unbracketed,
+                }
+            )
+        return ranking
+
     def filter_products(self):
         for product in self.products_by_id.values():
             for term in self.product_index.tokenize(product.name, ngrams=1):
@@ -0,0 +1,175 @@
+from array import array
+from itertools import accumulate
+
+
+def _csr(count, edges):
+    # Compressed sparse row adjacency: the targets of the edges from each source
+    # ordinal are stored contiguously, in the order that they were given, and
+    # offsets[source] .. offsets[source + 1] delimits them
+    counts = [0] * (count + 1)
+    for source, _ in edges:
+        counts[source + 1] += 1
+    offsets = array("l", accumulate(counts))
+    targets = array("l", bytes(offsets[-1] * offsets.itemsize))
+    cursor = list(offsets)
+    for source, target in edges:
+        targets[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, targets
+
+
+class ProductRelations:
+    # Is-a (parent and child) and substitution relations between products,
+    # addressed by the product ordinals of a ProductStore.
+    #
+    # Each product has at most one parent.  Products are labelled with the
+    # interval of a depth-first (preorder) traversal of the hierarchy that their
+    # descendants occupy, so that ancestry tests take constant time, and the
+    # descendants of a product are a contiguous slice of the traversal.
+    SECTIONS = (
+        "parents",
+        "child_offsets",
+        "children",
+        "preorder",
+        "entries",
+        "exits",
+        "substitute_offsets",
+        "substitutes",
+    )
+
+    def __init__(self, **arrays):
+        for name in self.SECTIONS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, ordinals, count, relations, order=None):
+        # Resolves the (product id, parent id, substitute ids) relations of each
+        # hierarchy record to ordinals; references to unknown products are
+        # ignored, and where a product has several records, the first parent
+        # given is used.  Cycles are broken, and children listed and traversed,
+        # in the given order of ordinals -- by default, ordinal order
+        order = range(count) if order is None else order
+        parents = array("l", [-1]) * count
+        substitutes = {}
+        for product_id, parent_id, substitute_ids in relations:
+            ordinal = ordinals.get(product_id)
+            if ordinal is None:
+                continue
+            parent = ordinals.get(parent_id)
+            if parent is not None and parent != ordinal and parents[ordinal] < 0:
+                parents[ordinal] = parent
+            for substitute_id in substitute_ids:
+                substitute = ordinals.get(substitute_id)
+                if substitute is not None and substitute != ordinal:
+                    substitutes.setdefault(ordinal, {})[substitute] = None
+
+        cycles = cls._break_cycles(parents, order)
+        if cycles:
+            print(f"Removed {cycles} cyclic product parent relations")
+
+        child_offsets, children = _csr(
+            count,
+            [(parents[child], child) for child in order if parents[child] >= 0],
+        )
+        substitute_offsets, substitute_ordinals = _csr(
+            count,
+            [
+                (ordinal, substitute)
+                for ordinal in sorted(substitutes)
+                for substitute in substitutes[ordinal]
+            ],
+        )
+
+        # Label each product with its position in a preorder traversal of the
+        # hierarchy, and the position that follows its last descendant
+        preorder = array("l")
+        entries = array("l", [-1]) * count
+        exits = array("l", [-1]) * count
+        for root in order:
+            if parents[root] >= 0:
+                continue
+            stack = [root]
+            while stack:
+                ordinal = stack.pop()
+                if ordinal < 0:
+                    exits[~ordinal] = len(preorder)
+                    continue
+                entries[ordinal] = len(preorder)
+                preorder.append(ordinal)
+                stack.append(~ordinal)
+                start, end = child_offsets[ordinal], child_offsets[ordinal + 1]
+                stack.extend(reversed(children[start:end]))
+
+        return cls(
+            parents=parents,
+            child_offsets=child_offsets,
+            children=children,
+            preorder=preorder,
+            entries=entries,
+            exits=exits,
+            substitute_offsets=substitute_offsets,
+            substitutes=substitute_ordinals,
+        )
+
+    @staticmethod
+    def _break_cycles(parents, order):
+        # Follows the parent chain from each product, in the given order; a chain
+        # that returns to a product on the current path is a cycle, which is
+        # broken by removing the parent relation that closes it
+        state = bytearray(len(parents))
+        cycles = 0
+        for ordinal in order:
+            path = []
+            while ordinal >= 0 and not state[ordinal]:
+                state[ordinal] = 1
+                path.append(ordinal)
+                ordinal = parents[ordinal]
+            if ordinal >= 0 and state[ordinal] == 1:
+                parents[path[-1]] = -1
+                cycles += 1
+            for node in path:
+                state[node] = 2
+        return cycles
+
+    def is_a(self, ordinal, ancestor):
+        # Whether a product is the given product, or one of its descendants
+        entry = self.entries[ancestor]
+        return entry <= self.entries[ordinal] < self.exits[ancestor]
+
+    def parent(self, ordinal):
+        parent = self.parents[ordinal]
+        return parent if parent >= 0 else None
+
+    def ancestors(self, ordinal):
+        # Nearest first
+        ancestors = []
+        ordinal = self.parents[ordinal]
+        while ordinal >= 0:
+            ancestors.append(ordinal)
+            ordinal = self.parents[ordinal]
+        return ancestors
+
+    def child_ordinals(self, ordinal):
+        start, end = self.child_offsets[ordinal], self.child_offsets[ordinal + 1]
+        return self.children[start:end].tolist()
+
+    def descendants(self, ordinal):
+        # In preorder, excluding the product itself
+        start, end = self.entries[ordinal] + 1, self.exits[ordinal]
+        return self.preorder[start:end].tolist()
+
+    def substitute_ordinals(self, ordinal):
+        start = self.substitute_offsets[ordinal]
+        end = self.substitute_offsets[ordinal + 1]
+        return self.substitutes[start:end].tolist()
+
+    def to_sections(self):
+        return {name: getattr(self, name).tobytes() for name in self.SECTIONS}
+
+    @classmethod
+    def from_sections(cls, sections):
+        arrays = {}
+        for name in cls.SECTIONS:
+            arrays[name] = array("l")
+            arrays[name].frombytes(sections[name])
+        return cls(**arrays)
@@ -0,0 +1,260 @@
+from array import array
+import sys
+
+from web.models.product import Product
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+class ProductView:
+    __slots__ = ("store", "ordinal")
+
+    stemmer = Product.stemmer
+
+    def __init__(self, store, ordinal):
+        self.store = store
+        self.ordinal = ordinal
+
+    @property
+    def id(self):
+        return self.store.ids[self.ordinal]
+
+    @property
+    def name(self):
+        return self.store.names[self.ordinal]
+
+    @property
+    def frequency(self):
+        return self.store.frequencies[self.ordinal]
+
+    @property
+    def stopwords(self):
+        return self.store.stopwords
+
+    def inflections(self):
+        singular = self.store.singulars[self.ordinal]
+        plural = self.store.plurals[self.ordinal]
+        if singular is None or plural is None:
+            return Product.inflections(self)
+        return singular, plural
+
+    def __eq__(self, other):
+        if not isinstance(other, ProductView):
+            return NotImplemented
+        return self.store is other.store and self.ordinal == other.ordinal
+
+    def __hash__(self):
+        return hash((id(self.store), self.ordinal))
+
+    __repr__ = Product.__repr__
+    to_dict = Product.to_dict
+    tokenize = Product.tokenize
+    to_doc = Product.to_doc
+    get_metadata = Product.get_metadata
+
+
+class ProductStore:
+    def __init__(self, stopwords=None):
+        self.stopwords = stopwords if stopwords is not None else []
+
+        # Products, addressed by dense integer ordinals
+        self.ordinals = {}
+        self.ids = []
+        self.names = []
+        self.frequencies = array("l")
+
+        # Singular and plural forms of each product name; None until inflected
+        self.singulars = []
+        self.plurals = []
+
+        # The hierarchy records that each product was merged from
+        self.record_ordinals = array("l")
+        self.record_names = []
+        self.record_frequencies = array("l")
+
+    def copy(self):
+        store = ProductStore.__new__(ProductStore)
+        store.stopwords = self.stopwords
+        store.ordinals = dict(self.ordinals)
+        store.ids = list(self.ids)
+        store.names = list(self.names)
+        store.frequencies = array("l", self.frequencies)
+        store.singulars = list(self.singulars)
+        store.plurals = list(self.plurals)
+        store.record_ordinals = array("l", self.record_ordinals)
+        store.record_names = list(self.record_names)
+        store.record_frequencies = array("l", self.record_frequencies)
+        return store
+
+    def add(self, product):
+        product_id = sys.intern(product.id)
+        name = sys.intern(product.name)
+
+        self.record_ordinals.append(len(self.ids))
+        ordinal = self.ordinals.get(product_id)
+        if ordinal is None:
+            ordinal = len(self.ids)
+            self.ordinals[product_id] = ordinal
+            self.ids.append(product_id)
+            self.names.append(name)
+            self.frequencies.append(product.frequency)
+            self.singulars.append(None)
+            self.plurals.append(None)
+        else:
+            # Merge duplicate products in the same way as Product.__add__
+            self.record_ordinals[-1] = ordinal
+            if not len(self.names[ordinal]) < len(name):
+                self.names[ordinal] = name
+                self.singulars[ordinal] = self.plurals[ordinal] = None
+            self.frequencies[ordinal] += product.frequency
+
+        self.record_names.append(name)
+        self.record_frequencies.append(product.frequency)
+        return ordinal
+
+    def records(self):
+        # The (name, frequency) of each hierarchy record, grouped by product id
+        records = {}
+        for ordinal, name, frequency in zip(
+            self.record_ordinals, self.record_names, self.record_frequencies
+        ):
+            records.setdefault(self.ids[ordinal], []).append((name, frequency))
+        return records
+
+    def order(self):
+        # Every ordinal: those of products in the order in which they first
+        # appear in the hierarchy, followed by any left unused by removals
+        return list(dict.fromkeys([*self.record_ordinals, *range(len(self.ids))]))
+
+    def replace(self, product_id, records):
+        # Replaces a product with one merged from the given (name, frequency)
+        # records, as add would have merged them; the product keeps its ordinal
+        name, frequency = records[0]
+        for other_name, other_frequency in records[1:]:
+            if not len(name) < len(other_name):
+                name = other_name
+            frequency += other_frequency
+        name = sys.intern(name)
+
+        ordinal = self.ordinals.get(product_id)
+        if ordinal is None:
+            product_id = sys.intern(product_id)
+            ordinal = self.ordinals[product_id] = len(self.ids)
+            self.ids.append(product_id)
+            self.names.append(name)
+            self.frequencies.append(frequency)
+            self.singulars.append(None)
+            self.plurals.append(None)
+            return ordinal
+
+        if self.names[ordinal] != name:
+            self.names[ordinal] = name
+            self.singulars[ordinal] = self.plurals[ordinal] = None
+        self.frequencies[ordinal] = frequency
+        return ordinal
+
+    def remove(self, product_id):
+        # Ordinals are not reused, so that other ordinal-addressed structures
+        # remain valid; the removed product's slots are cleared instead
+        ordinal = self.ordinals.pop(product_id)
+        self.ids[ordinal] = self.names[ordinal] = None
+        self.singulars[ordinal] = self.plurals[ordinal] = None
+        self.frequencies[ordinal] = 0
+        return ordinal
+
+    def set_records(self, products):
+        self.record_ordinals = array("l", (self.ordinals[p.id] for p in products))
+        self.record_names = [sys.intern(product.name) for product in products]
+        self.record_frequencies = array("l", (p.frequency for p in products))
+
+    def inflect(self, executor=None, chunk_size=1000):
+        # Compute singular and plural forms for any products that lack them,
+        # optionally spreading the work across an executor's worker processes
+        ordinals = [
+            ordinal
+            for ordinal, singular in enumerate(self.singulars)
+            if (singular is None or self.plurals[ordinal] is None)
+            and self.names[ordinal] is not None
+        ]
+        names = [self.names[ordinal] for ordinal in ordinals]
+        chunks = []
+        for start in range(0, len(names), chunk_size):
+            end = start + chunk_size
+            chunks.append(names[start:end])
+        results = map(Product.inflect_names, chunks)
+        if executor and len(chunks) > 1:
+            results = executor.map(Product.inflect_names, chunks)
+
+        inflections = (inflection for chunk in results for inflection in chunk)
+        for ordinal, (singular, plural) in zip(ordinals, inflections):
+            self.singulars[ordinal] = sys.intern(singular)
+            self.plurals[ordinal] = sys.intern(plural)
+
+    def view(self, ordinal):
+        return ProductView(self, ordinal)
+
+    def ordinal(self, product_id):
+        return self.ordinals.get(product_id)
+
+    def get(self, product_id, default=None):
+        ordinal = self.ordinals.get(product_id)
+        if ordinal is None:
+            return default
+        return ProductView(self, ordinal)
+
+    def __getitem__(self, product_id):
+        return ProductView(self, self.ordinals[product_id])
+
+    def __contains__(self, product_id):
+        return product_id in self.ordinals
+
+    def __iter__(self):
+        return (product_id for product_id in self.ids if product_id is not None)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (
+            ProductView(self, ordinal)
+            for ordinal, product_id in enumerate(self.ids)
+            if product_id is not None
+        )
+
+    def items(self):
+        return ((product.id, product) for product in self.values())
+
+    def to_sections(self):
+        return {
+            "ids": self.ids,
+            "names": self.names,
+            "frequencies": self.frequencies.tobytes(),
+            "singulars": self.singulars,
+            "plurals": self.plurals,
+            "record_ordinals": self.record_ordinals.tobytes(),
+            "record_names": self.record_names,
+            "record_frequencies": self.record_frequencies.tobytes(),
+        }
+
+    @classmethod
+    def from_sections(cls, sections, stopwords=None):
+        store = cls(stopwords=stopwords)
+        store.ids = [_intern(product_id) for product_id in sections["ids"]]
+        store.names = [_intern(name) for name in sections["names"]]
+        store.frequencies.frombytes(sections["frequencies"])
+        store.singulars = [_intern(singular) for singular in sections["singulars"]]
+        store.plurals = [_intern(plural) for plural in sections["plurals"]]
+        store.ordinals = {
+            product_id: ordinal
+            for ordinal, product_id in enumerate(store.ids)
+            if product_id is not None
+        }
+        store.record_ordinals.frombytes(sections["record_ordinals"])
+        store.record_names = [sys.intern(name) for name in sections["record_names"]]
+        store.record_frequencies.frombytes(sections["record_frequencies"])
+        return store
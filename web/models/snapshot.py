@@ -0,0 +1,122 @@
+from collections import Counter
+import json
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+
+# Snapshot layout:
+#
+#   magic (8 bytes) | header length (uint32, little-endian) | header (JSON)
+#   | section payloads (marshal-encoded)
+#
+# The header records the format revision, the hierarchy version that the graph
+# was built from and the byte range of each section, so that a stale snapshot
+# can be rejected without decoding any of its payload.
+SNAPSHOT_MAGIC = b"KGSNAP\0\0"
+SNAPSHOT_FORMAT = 5
+
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def index_sections(index):
+    return {
+        "documents": dict(index.index._documents),
+        "terms": {term: dict(docs) for term, docs in index.index._terms.items()},
+    }
+
+
+def restore_index(index, sections):
+    index.index._documents = Counter(sections["documents"])
+    index.index._terms = sections["terms"]
+    return index
+
+
+def write_snapshot(path, version, sections, validators=None):
+    offset, payloads, ranges = 0, [], {}
+    for name, section in sections.items():
+        payload = marshal.dumps(section)
+        ranges[name] = (offset, len(payload))
+        payloads.append(payload)
+        offset += len(payload)
+
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "validators": validators or {},
+        "sections": ranges,
+    }
+    header = json.dumps(header).encode()
+
+    # Write to a temporary file and then rename it into place, so that readers
+    # in other processes never observe a partially-written snapshot
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            for payload in payloads:
+                f.write(payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _read_header(buffer):
+    magic_length = len(SNAPSHOT_MAGIC)
+    if bytes(buffer[:magic_length]) != SNAPSHOT_MAGIC:
+        raise SnapshotError("Unrecognized snapshot file")
+    (header_length,) = _HEADER_LENGTH.unpack_from(buffer, magic_length)
+    header_start = magic_length + _HEADER_LENGTH.size
+    header_end = header_start + header_length
+    header = json.loads(bytes(buffer[header_start:header_end]))
+    if header.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format: {header.get('format')}")
+    return header, header_end
+
+
+def read_snapshot(path, version=None, header_only=False):
+    try:
+        with open(path, "rb") as f:
+            return _read_snapshot(f, version, header_only)
+    except FileNotFoundError:
+        raise SnapshotError(f"Snapshot not found: {path}")
+    except (EOFError, ValueError, struct.error) as e:
+        raise SnapshotError(f"Snapshot is corrupt: {path}: {e}")
+
+
+def read_snapshot_header(path):
+    header, _ = read_snapshot(path, header_only=True)
+    return header
+
+
+def _read_snapshot(f, version, header_only):
+    # Map the snapshot read-only: page-cache pages are shared between all of the
+    # worker processes reading the same file, and sections are decoded directly
+    # from the mapping without an intermediate copy of the file contents
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+        buffer = memoryview(mapping)
+        try:
+            header, payload_start = _read_header(buffer)
+            if version is not None and header["version"] != version:
+                raise SnapshotError(
+                    f"Snapshot version {header['version']} does not match {version}"
+                )
+            sections = {}
+            if header_only:
+                return header, sections
+            for name, (offset, length) in header["sections"].items():
+                start = payload_start + offset
+                end = start + length
+                sections[name] = marshal.loads(buffer[start:end])
+        finally:
+            buffer.release()
+    return header, sections
@@ -0,0 +1,59 @@
+from bisect import bisect_right
+import re
+
+_re_bracket = re.compile(r"[()\[\]{}]")
+_openers = {")": "(", "]": "[", "}": "{"}
+
+
+# Removes bracketed content (including the brackets) from a description, and
+# returns the remaining text along with an offset map: a list of (offset,
+# original offset) pairs marking the start of each segment of retained text.
+#
+# Brackets are matched by type, and may be nested.  A closing bracket that does
+# not match the innermost open bracket closes the nearest enclosing bracket of
+# its type (and any brackets opened within it), or is ignored if there is none;
+# closing brackets outside of any group are retained as text, and a group that
+# is never closed extends to the end of the description.
+def strip_brackets(description):
+    brackets = list(_re_bracket.finditer(description))
+    if not brackets:
+        return description, [(0, 0)]
+
+    pieces, segments, stack = [], [], []
+    position, length = 0, 0
+    for bracket in brackets:
+        char, index = bracket.group(), bracket.start()
+        opener = _openers.get(char)
+        if opener is None:
+            if not stack and index > position:
+                pieces.append(description[position:index])
+                segments.append((length, position))
+                length += index - position
+            stack.append(char)
+        elif opener in stack:
+            depth = len(stack) - stack[::-1].index(opener) - 1
+            del stack[depth:]
+            if not stack:
+                position = index + 1
+
+    if not stack and position < len(description):
+        pieces.append(description[position:])
+        segments.append((length, position))
+    return "".join(pieces), segments or [(0, 0)]
+
+
+def strip_brackets_batch(descriptions):
+    return [strip_brackets(description) for description in descriptions]
+
+
+# Maps an offset within stripped text back to the original description
+def original_offset(segments, offset):
+    index = bisect_right(segments, (offset, float("inf"))) - 1
+    start, original_start = segments[index]
+    return original_start + offset - start
+
+
+# Maps a (start, end) span within stripped text back to the original description
+def original_span(segments, span):
+    start, end = span
+    return original_offset(segments, start), original_offset(segments, end - 1) + 1
@@ -1,11 +1,64 @@
-from flask import abort, jsonify
+import os
+
+from flask import abort, jsonify, request
 
 from web.app import app
 
+PRODUCTS_BATCH_LIMIT = int(os.environ.get("PRODUCTS_BATCH_LIMIT", 500))
+PRODUCTS_MAX_AGE = int(os.environ.get("PRODUCTS_MAX_AGE", 300))
+
+
+def ready_graph():
+    # Product lookups may be the first requests that a worker receives, so they
+    # wait for the initial graph load rather than relying on a prior query
+    try:
+        return app.graph_manager.ensure_loaded()
+    except RuntimeError as e:
+        abort(503, str(e))
+
+
+def requested_ids(field="ids[]"):
+    product_ids = request.values.getlist(field)
+    if len(product_ids) > PRODUCTS_BATCH_LIMIT:
+        abort(400, f"At most {PRODUCTS_BATCH_LIMIT} products may be requested")
+    return product_ids
+
+
+def product_response(graph, render):
+    # Product metadata changes only when the graph is replaced, so responses to
+    # lookups are validated by graph version, and may be cached by clients and
+    # proxies; large batches may be posted instead, and are not cached
+    if request.method == "POST":
+        return jsonify(render())
+    if graph.version in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(render())
+    response.set_etag(graph.version)
+    response.cache_control.public = True
+    response.cache_control.max_age = PRODUCTS_MAX_AGE
+    return response
+
 
 @app.route("/products/<product_id>")
 def product(product_id):
-    product = app.graph.products_by_id.get(product_id)
+    graph = ready_graph()
+    product = graph.products_by_id.get(product_id)
     if not product:
         return abort(404)
-    return jsonify(product.get_metadata(product.name, app.graph))
+    return product_response(graph, lambda: product.get_metadata(product.name, graph))
+
+
+@app.route("/products", methods=["GET", "POST"])
+def products():
+    product_ids = requested_ids()
+    graph = ready_graph()
+
+    def render():
+        results = {}
+        for product_id in product_ids:
+            product = graph.products_by_id.get(product_id)
+            results[product_id] = product and product.get_metadata(product.name, graph)
+        return {"results": results}
+
+    return product_response(graph, render)
@@ -0,0 +1,57 @@
+from datetime import UTC, datetime
+import io
+import pstats
+
+from flask import Response, abort, jsonify, request, send_file
+
+from web import profiling
+from web.app import app
+
+if profiling.PROFILE_TOKEN or profiling.PROFILE_SAMPLE_RATE:
+    app.wsgi_app = profiling.ProfilingMiddleware(app.wsgi_app)
+
+
+def require_profile_token():
+    if not profiling.PROFILE_TOKEN:
+        abort(404)
+    if not profiling.has_token(request.headers.get("X-Profile-Token")):
+        abort(403)
+
+
+@app.route("/profiles")
+def profiles():
+    require_profile_token()
+    results = []
+    for entry in profiling.list_profiles():
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        created = datetime.fromtimestamp(stat.st_mtime, tz=UTC)
+        results.append(
+            {"name": entry.name, "bytes": stat.st_size, "created": created.isoformat()}
+        )
+    return jsonify({"profiles": results})
+
+
+@app.route("/profiles/<name>")
+def profile(name):
+    require_profile_token()
+    entries = {entry.name: entry.path for entry in profiling.list_profiles()}
+    if name not in entries:
+        abort(404)
+
+    # Profiles are downloaded in pstats format, or rendered as text (sorted by
+    # cumulative time) with ?format=text
+    if request.args.get("format") != "text":
+        return send_file(
+            entries[name],
+            mimetype="application/octet-stream",
+            as_attachment=True,
+            download_name=name,
+        )
+    stream = io.StringIO()
+    stats = pstats.Stats(entries[name], stream=stream)
+    stats.sort_stats("cumulative")
+    stats.print_stats(request.args.get("limit", 50, type=int))
+    return Response(stream.getvalue(), mimetype="text/plain")
@@ -0,0 +1,140 @@
+import cProfile
+from datetime import UTC, datetime
+import hmac
+import itertools
+import os
+import random
+import threading
+
+# Opt-in profiling of individual queries and product graph loads.  Queries are
+# profiled when they carry the PROFILE_TOKEN in an X-Profile-Token header, or
+# when sampled at PROFILE_SAMPLE_RATE; graph loads are profiled according to
+# PROFILE_GRAPH_LOADS ("startup" for the initial load only, or "all").  The
+# profiling middleware is only installed (by the profiles module) when query
+# profiling is configured, so that requests are otherwise unaffected.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_GRAPH_LOADS = os.environ.get("PROFILE_GRAPH_LOADS", "").lower()
+PROFILE_DIRECTORY = os.environ.get("PROFILE_DIRECTORY", "/var/tmp/profiles")
+PROFILE_RETENTION = int(os.environ.get("PROFILE_RETENTION", 20))
+
+PROFILED_PATHS = {
+    "/ingredients/query": "ingredients",
+    "/directions/query": "directions",
+}
+PROFILE_SUFFIX = ".prof"
+
+# Only one profiler may be active at a time; requests that would be profiled
+# while another profile is in progress are served without profiling
+_profiler_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def profile_name(kind):
+    timestamp = datetime.now(tz=UTC).strftime("%Y%m%dT%H%M%S.%f")
+    return f"{timestamp}-{kind}-{os.getpid()}-{next(_sequence)}{PROFILE_SUFFIX}"
+
+
+def list_profiles():
+    # Newest first; profiles from all worker processes share the directory
+    try:
+        entries = [
+            entry
+            for entry in os.scandir(PROFILE_DIRECTORY)
+            if entry.name.endswith(PROFILE_SUFFIX) and entry.is_file()
+        ]
+    except FileNotFoundError:
+        return []
+    return sorted(entries, key=lambda entry: entry.name, reverse=True)
+
+
+def save_profile(profiler, name):
+    # Written to a temporary file and renamed into place, so that listings
+    # never include a partially-written profile; the oldest profiles are then
+    # removed, retaining at most PROFILE_RETENTION
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    path = os.path.join(PROFILE_DIRECTORY, name)
+    profiler.dump_stats(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    for entry in list_profiles()[PROFILE_RETENTION:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    print(f"Saved profile {name}")
+
+
+def run_profiled(kind, function, *args):
+    # Returns the function's result and the name of the saved profile, or None
+    # if another profile was in progress, or if the profile was not saved
+    if not _profiler_lock.acquire(blocking=False):
+        return function(*args), None
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = function(*args)
+        finally:
+            profiler.disable()
+        name = profile_name(kind)
+        try:
+            save_profile(profiler, name)
+        except OSError as e:
+            print(f"Failed to write profile {name}: {e}")
+            name = None
+        return result, name
+    finally:
+        _profiler_lock.release()
+
+
+def has_token(token):
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token or "", PROFILE_TOKEN)
+
+
+class ProfilingMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        kind = PROFILED_PATHS.get(environ.get("PATH_INFO"))
+        if kind is None or not (
+            has_token(environ.get("HTTP_X_PROFILE_TOKEN"))
+            or random.random() < PROFILE_SAMPLE_RATE
+        ):
+            return self.wsgi_app(environ, start_response)
+
+        # The response is buffered so that it is produced within the profile,
+        # and so that its headers can name the saved profile
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response["start"] = status, headers, exc_info
+            return response.setdefault("body", []).append
+
+        def respond():
+            iterable = self.wsgi_app(environ, capture)
+            try:
+                return b"".join(iterable)
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+
+        body, name = run_profiled(kind, respond)
+        status, headers, exc_info = response["start"]
+        if name:
+            headers = [*headers, ("X-Profile", name)]
+        start_response(status, headers, exc_info)
+        return [*response.get("body", []), body]
+
+
+def profile_graph_loads(loader):
+    def load(previous=None):
+        if PROFILE_GRAPH_LOADS == "all" or (
+            PROFILE_GRAPH_LOADS == "startup" and previous is None
+        ):
+            kind = "graph-update" if previous else "graph-load"
+            graph, _ = run_profiled(kind, loader, previous)
+            return graph
+        return loader(previous)
+
+    return load
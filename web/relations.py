@@ -0,0 +1,76 @@
+from web.app import app
+from web.models.product_relations import ProductRelations
+from web.products import product_response, ready_graph, requested_ids
+
+
+def relation_response(query):
+    # Maps each requested product id to the ids of its related products, or to
+    # None if the product is unknown
+    product_ids = requested_ids()
+    graph = ready_graph()
+    store = graph.products_by_id
+
+    def render():
+        results = {}
+        for product_id in product_ids:
+            ordinal = store.ordinal(product_id)
+            if ordinal is None:
+                results[product_id] = None
+                continue
+            related = query(graph.relations, ordinal)
+            results[product_id] = [store.ids[ordinal] for ordinal in related]
+        return {"results": results}
+
+    return product_response(graph, render)
+
+
+@app.route("/relations/ancestors", methods=["GET", "POST"])
+def ancestors():
+    return relation_response(ProductRelations.ancestors)
+
+
+@app.route("/relations/children", methods=["GET", "POST"])
+def children():
+    return relation_response(ProductRelations.child_ordinals)
+
+
+@app.route("/relations/descendants", methods=["GET", "POST"])
+def descendants():
+    return relation_response(ProductRelations.descendants)
+
+
+@app.route("/relations/substitutes", methods=["GET", "POST"])
+def substitutes():
+    return relation_response(ProductRelations.substitute_ordinals)
+
+
+@app.route("/relations/is-a", methods=["GET", "POST"])
+def is_a():
+    # Whether each of the requested products is a kind of (or is) each of the
+    # requested ancestors; unknown products and ancestors are reported as None
+    product_ids = requested_ids()
+    ancestor_ids = requested_ids("ancestor_ids[]")
+    graph = ready_graph()
+    store = graph.products_by_id
+    ancestors = {
+        ancestor_id: store.ordinal(ancestor_id) for ancestor_id in ancestor_ids
+    }
+
+    def render():
+        results = {}
+        for product_id in product_ids:
+            ordinal = store.ordinal(product_id)
+            if ordinal is None:
+                results[product_id] = None
+                continue
+            results[product_id] = {
+                ancestor_id: (
+                    None
+                    if ancestor is None
+                    else graph.relations.is_a(ordinal, ancestor)
+                )
+                for ancestor_id, ancestor in ancestors.items()
+            }
+        return {"results": results}
+
+    return product_response(graph, render)
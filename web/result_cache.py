@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import sys
+from threading import Lock, local
+
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", 100000))
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH")
+RESULT_CACHE_SHARED_ENTRIES = int(
+    os.environ.get("RESULT_CACHE_SHARED_ENTRIES", 1000000)
+)
+QUERY_CHUNK_LINES = int(os.environ.get("QUERY_CHUNK_LINES", 1000))
+
+# SQLite limits the number of parameters in a single statement
+_QUERY_CHUNK_SIZE = 500
+
+# The approximate memory used by each cache entry, besides its description and
+# serialized result: the key and value tuples, and the mapping's slot and links
+_ENTRY_OVERHEAD = 200
+
+
+class SharedResultCache:
+    def __init__(self, path, max_entries=RESULT_CACHE_SHARED_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = local()
+        self.writes = 0
+
+    @property
+    def connection(self):
+        # Connections are opened per-thread, and must not cross a fork
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "namespace TEXT, version TEXT, description TEXT, value TEXT, "
+                "PRIMARY KEY (namespace, version, description))"
+            )
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def get_many(self, namespace, version, descriptions):
+        values = {}
+        for start in range(0, len(descriptions), _QUERY_CHUNK_SIZE):
+            end = start + _QUERY_CHUNK_SIZE
+            chunk = descriptions[start:end]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                "SELECT description, value FROM results "
+                "WHERE namespace = ? AND version = ? "
+                f"AND description IN ({placeholders})",
+                [namespace, version, *chunk],
+            )
+            values.update(rows)
+        return values
+
+    def put_many(self, namespace, version, values):
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                [(namespace, version, *item) for item in values.items()],
+            )
+        self.writes += len(values)
+        if self.writes >= self.max_entries // 10:
+            self.writes = 0
+            self.prune(namespace, version)
+
+    def prune(self, namespace, version):
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN")
+            connection.execute(
+                "DELETE FROM results WHERE namespace = ? AND version != ?",
+                [namespace, version],
+            )
+            connection.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                "SELECT rowid FROM results ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                [self.max_entries],
+            )
+
+
+class ResultCache:
+    def __init__(
+        self,
+        namespace,
+        max_entries=RESULT_CACHE_ENTRIES,
+        max_bytes=RESULT_CACHE_BYTES,
+        path=RESULT_CACHE_PATH,
+    ):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = SharedResultCache(path) if path else None
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0, "errors": 0}
+
+    def get_many(self, version, descriptions):
+        # Results are held serialized, which uses a fraction of the memory of the
+        # equivalent objects, and are decoded afresh for each request
+        cached = {}
+        with self.lock:
+            for description in descriptions:
+                key = version, description
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    cached[description] = entry[0]
+        results = {d: json.loads(serialized) for d, serialized in cached.items()}
+
+        misses = [d for d in dict.fromkeys(descriptions) if d not in results]
+        shared = {}
+        if misses and self.shared:
+            try:
+                shared = self.shared.get_many(self.namespace, version, misses)
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                print(f"Failed to read shared result cache: {e}")
+            for description, serialized in shared.items():
+                results[description] = json.loads(serialized)
+                self._store(version, description, serialized)
+
+        self.stats["hits"] += len(results) - len(shared)
+        self.stats["shared_hits"] += len(shared)
+        self.stats["misses"] += len(misses) - len(shared)
+        return results
+
+    def put_many(self, version, results):
+        serialized = {}
+        for description, result in results.items():
+            serialized[description] = json.dumps(result, separators=(",", ":"))
+            self._store(version, description, serialized[description])
+
+        if serialized and self.shared:
+            try:
+                self.shared.put_many(self.namespace, version, serialized)
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                print(f"Failed to write shared result cache: {e}")
+
+    def _store(self, version, description, serialized):
+        size = sys.getsizeof(description) + sys.getsizeof(serialized)
+        size += _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        key = version, description
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = serialized, size
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def fetch(self, version, descriptions, compute, chunk_size=QUERY_CHUNK_LINES):
+        # Returns a result for each description, computing only those results
+        # that are not already cached -- once per distinct description, in input
+        # order and in batches of at most chunk_size.  Each batch is cached as it
+        # completes, so that the memory used by very large requests is bounded,
+        # and so that work completed for an interrupted request is retained
+        results = self.get_many(version, descriptions)
+        misses = [d for d in dict.fromkeys(descriptions) if d not in results]
+        for start in range(0, len(misses), chunk_size):
+            end = start + chunk_size
+            computed = compute(misses[start:end])
+            self.put_many(version, computed)
+            results.update(computed)
+        return results
+
+    def statistics(self):
+        with self.lock:
+            entries, size = len(self.entries), self.size
+        return dict(self.stats, entries=entries, bytes=size)
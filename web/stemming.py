@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import os
+from threading import Lock
+
+STEMMER_CACHE_SIZE = int(os.environ.get("STEMMER_CACHE_SIZE", 65536))
+
+
+class StemmingService:
+    # Snowball stemmers hold per-word state, so stemming is serialized; the lock
+    # belongs with the stemmer, and subclasses whose instances share a stemmer
+    # share a lock alongside it
+    lock = Lock()
+
+    def __init__(self, maxsize=STEMMER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        # Stems of a known vocabulary (for example, the words of each product
+        # name), followed by a bounded cache of other recently-stemmed words
+        self.vocabulary = {}
+        self.cache = OrderedDict()
+
+    def stem_word(self, term):
+        raise NotImplementedError
+
+    def _stem_miss(self, term):
+        with self.lock:
+            stemmed = self.stem_word(term)
+            if self.maxsize > 0:
+                if len(self.cache) >= self.maxsize:
+                    self.cache.popitem(last=False)
+                self.cache[term] = stemmed
+        return stemmed
+
+    def _stem_cached(self, term):
+        # Cache hits are moved to the end of the cache, so that the least-recently
+        # used words are evicted first; another thread may evict the word between
+        # the lookup and the move
+        stemmed = self.cache.get(term)
+        if stemmed is not None:
+            try:
+                self.cache.move_to_end(term)
+            except KeyError:
+                pass
+        return stemmed
+
+    def stem(self, term):
+        stemmed = self.vocabulary.get(term)
+        if stemmed is None:
+            stemmed = self._stem_cached(term)
+        if stemmed is None:
+            self.misses += 1
+            return self._stem_miss(term)
+        self.hits += 1
+        return stemmed
+
+    def stem_many(self, terms):
+        vocabulary = self.vocabulary
+        results, misses = [], 0
+        for term in terms:
+            stemmed = vocabulary.get(term)
+            if stemmed is None:
+                stemmed = self._stem_cached(term)
+            if stemmed is None:
+                misses += 1
+                stemmed = self._stem_miss(term)
+            results.append(stemmed)
+        self.hits += len(results) - misses
+        self.misses += misses
+        return results
+
+    def build_vocabulary(self, terms):
+        terms = sorted(set(terms))
+        return dict(zip(terms, self.stem_many(terms)))
+
+    def use_vocabulary(self, vocabulary):
+        # The table is replaced rather than mutated, so that readers in other
+        # threads always observe a complete table
+        self.vocabulary = vocabulary
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cache_entries": len(self.cache),
+            "cache_size": self.maxsize,
+            "vocabulary_entries": len(self.vocabulary),
+        }
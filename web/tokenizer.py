@@ -0,0 +1,90 @@
+import re
+from string import punctuation
+
+# These patterns mirror the default tokenization rules of hashedindex's
+# word_tokenize (possessive removal, punctuation removal and lowercasing), so
+# that tokens produced here are identical to the terms stored in search indexes
+_punctuation = "".join(char for char in punctuation if char not in "\\/-")
+_re_removed = re.compile("'s|[%s]" % re.escape(_punctuation))
+_re_word = re.compile(r"[\w%s]+" % re.escape("\\/-"))
+
+
+def _filter_text(text):
+    # Returns the text with removable characters dropped, along with the offset
+    # of each remaining character within the original text (or None, when the
+    # text is unchanged)
+    removals = list(_re_removed.finditer(text))
+    if not removals:
+        return text, None
+
+    pieces, offsets, position = [], [], 0
+    for removal in removals:
+        start, end = removal.span()
+        pieces.append(text[position:start])
+        offsets.extend(range(position, start))
+        position = end
+    pieces.append(text[position:])
+    offsets.extend(range(position, len(text)))
+    return "".join(pieces), offsets
+
+
+def _lower(text, offsets):
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, offsets
+
+    # Rarely, lowercasing changes the length of the text; re-map offsets
+    offsets = offsets or range(len(text))
+    pieces, lowered_offsets = [], []
+    for char, offset in zip(text, offsets):
+        char = char.lower()
+        pieces.append(char)
+        lowered_offsets.extend([offset] * len(char))
+    return "".join(pieces), lowered_offsets
+
+
+# Produces (term, start, end) tuples for each word in the text, where start and
+# end are the character offsets of the word within the original text
+def tokenize(text, stemmer=None):
+    filtered, offsets = _filter_text(text)
+    filtered, offsets = _lower(filtered, offsets)
+
+    matches = list(_re_word.finditer(filtered))
+    terms = [match.group() for match in matches]
+    if stemmer:
+        terms = stemmer.stem_many(terms)
+
+    tokens = []
+    for term, match in zip(terms, matches):
+        start, end = match.span()
+        if offsets is not None:
+            start, end = offsets[start], offsets[end - 1] + 1
+        tokens.append((term, start, end))
+    return tokens
+
+
+# Produces (terms, start, end) tuples for each sequence of n consecutive tokens,
+# omitting any sequences that contain a stopword
+def ngrams(tokens, n, stopwords=()):
+    for index in range(len(tokens) - n + 1):
+        end = index + n
+        window = tokens[index:end]
+        terms = tuple(term for term, _, _ in window)
+        if stopwords and any(term in stopwords for term in terms):
+            continue
+        yield terms, window[0][1], window[-1][2]
+
+
+# Produces (term, start, end) tuples for each occurrence of the given terms
+# within the tokens; where several of the terms begin at the same token, only
+# the longest is produced
+def find_terms(tokens, terms):
+    lengths = sorted({len(term) for term in terms if term}, reverse=True)
+    words = [term for term, _, _ in tokens]
+    for index in range(len(tokens)):
+        for n in lengths:
+            end = index + n
+            term = tuple(words[index:end])
+            if len(term) == n and term in terms:
+                yield term, tokens[index][1], tokens[end - 1][2]
+                break